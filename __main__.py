@@ -1,11 +1,18 @@
+import os
 from pathlib import Path
 
 import bson
 from prodict import Prodict
 
+from main.domain import compact_permissions
 from main.updater import Updater
 
 model_json = Path("model.json").read_bytes()
-model = Prodict.from_dict(bson.loads(model_json))
+model = compact_permissions(Prodict.from_dict(bson.loads(model_json)))
 
-Updater(model).update_all()
+# Sharded mode: each shard (e.g. "mysql:eu-west-2") has its own Pulumi stack.
+shard = os.environ.get("SARI_SHARD")
+if shard:
+    Updater(model).update_shard(shard)
+else:
+    Updater(model).update_all()
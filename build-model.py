@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import io
 import json
 import os
 import sys
@@ -11,9 +12,11 @@ import bson
 from loguru import logger
 
 from main.aws_client import AwsClient
-from main.domain import log_issues
+from main.domain import encode_permission, log_issues
 from main.gatherer import ModelBuilder
-from main.util import purge_pulumi_stack
+from main.updater import ALL_SHARDS, ModelChanges
+from main.gatherer.dbinfo import ENGINE_TYPE
+from main.util import get_mysql_provider_endpoints, purge_pulumi_stack
 
 
 def main():
@@ -22,33 +25,66 @@ def main():
                format="<green>{time:HH:mm:ss.SSS}</green> {level} <lvl>{message}</lvl>")
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('--model', required=True,
+    parser.add_argument('--model',
                         help='Output file to contain the resulting model.')
     parser.add_argument('--purge-pulumi-stack', action='store_true',
                         help='Purge zombie resources from Pulumi Stack.')
+    parser.add_argument('--pulumi-stack', action='append', dest='pulumi_stacks', default=[],
+                        help='Pulumi Stack to purge, instead of the selected one. May be repeated.')
+    parser.add_argument('--changed-shards',
+                        help='Output file to contain the shards affected by the model changes since the last '
+                             'successful update, one per line ("*" if not sharded).')
+    parser.add_argument('--shard', action='append', dest='shards', default=[],
+                        help='Shard updated on its own stack (or, with --commit-changes, successfully updated). '
+                             'May be repeated.')
+    parser.add_argument('--provenance',
+                        help='Output file to contain the gatherer that set each value of the model, by path.')
+    parser.add_argument('--commit-changes', action='store_true',
+                        help='Only record the model of the current update as successfully applied.')
     args = parser.parse_args()
+    model_changes = ModelChanges(os.environ.get("SARI_CACHE_DIR"), os.environ["PULUMI_STACK_NAME"]) \
+        if args.changed_shards or args.commit_changes else None
+    if args.commit_changes:
+        model_changes.commit(args.shards or [ALL_SHARDS])
+        return
+    if not args.model:
+        parser.error("the following arguments are required: --model")
 
-    model, issues = ModelBuilder().build()
+    builder = ModelBuilder(trace_provenance=bool(args.provenance))
+    model, issues = builder.build()
     log_issues(issues)
 
-    model_json = bson.dumps(model)
-    # TODO: avoid persisting passwords in plain.
-    #  How: assuming only SSM-stored passwords are supported, postpone dereferencing them to the next stage.
+    if args.provenance:
+        provenance = {".".join(path): source for path, source in builder.provenance.items()}
+        Path(args.provenance).write_text(json.dumps(provenance, indent=2, sort_keys=True))
+
+    if args.changed_shards:
+        changed_shards = model_changes.select_shards(model, args.shards)
+        Path(args.changed_shards).write_text("".join(f"{shard}\n" for shard in changed_shards))
+
+    model_json = bson.dumps(model, on_unknown=encode_permission)
+    # Unless SARI_LAZY_SECRETS is set, the master passwords are persisted in plain.
     Path(args.model).write_bytes(model_json)
 
     if args.purge_pulumi_stack:
-        do_purge_pulumi_stack()
+        for stack in (args.pulumi_stacks or [None]):
+            do_purge_pulumi_stack(stack)
 
 
-def do_purge_pulumi_stack():
-    with Popen(["pulumi", "--non-interactive", "stack", "export"], stdout=PIPE) as proc:
-        original_stack = json.loads(proc.stdout.read())
-    live_rds_endpoints = AwsClient.get_rds_known_endpoints()
+def do_purge_pulumi_stack(stack: str = None):
+    stack_args = ["--stack", stack] if stack else []
+    # The stack is parsed straight from the pipe, and the purged one written to it piecewise: no full copy of
+    # the export is ever kept in memory.
+    with Popen(["pulumi", "--non-interactive", "stack", "export", *stack_args], stdout=PIPE) as proc:
+        original_stack = json.load(proc.stdout)
+    # The instances not enumerated (e.g. no longer configured) may still be alive.
+    live_rds_endpoints = AwsClient.rds_discover_endpoints(ENGINE_TYPE, get_mysql_provider_endpoints(original_stack))
     updated_stack, num_changes = purge_pulumi_stack(original_stack, live_rds_endpoints)
     if num_changes > 0:
-        logger.info(f"Purging {num_changes} resources from Pulumi Stack")
-        with Popen(["pulumi", "--non-interactive", "stack", "import"], stdin=PIPE) as proc:
-            proc.stdin.write(json.dumps(updated_stack).encode())
+        logger.info(f"Purging {num_changes} resources from Pulumi Stack {stack or ''}".rstrip())
+        with Popen(["pulumi", "--non-interactive", "stack", "import", *stack_args], stdin=PIPE) as proc:
+            with io.TextIOWrapper(proc.stdin, encoding="utf-8") as stdin:
+                json.dump(updated_stack, stdin)
 
 
 def in_automation():
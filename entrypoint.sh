@@ -4,18 +4,97 @@
 set -eux
 
 MODEL_JSON=model.json
-trap "rm -f $MODEL_JSON" EXIT
+# The shards (or "*" if not sharded) affected by the model changes since the last successful update
+CHANGED_SHARDS=changed-shards.txt
+trap "rm -f $MODEL_JSON $CHANGED_SHARDS" EXIT
 
 PULUMI_ACTION="$@"
 
+# Only preview and up are skipped (or limited to the changed shards) when the model is unchanged: the other actions,
+# e.g. refresh or destroy, act on the live resources whatever the model.
+CHANGED_SHARDS_ARG=""
+if [[ "${PULUMI_ACTION:-preview}" == preview* || "${PULUMI_ACTION:-preview}" == up* ]]; then
+    CHANGED_SHARDS_ARG="--changed-shards=$CHANGED_SHARDS"
+fi
+
 if [ -n "${PULUMI_BACKEND_URL:-}" ]; then
     pulumi --non-interactive login --cloud-url $PULUMI_BACKEND_URL
 else
     pulumi --non-interactive login --local
 fi
 
-pulumi --non-interactive stack select $PULUMI_STACK_NAME --create
+# Inline mode: the model is built and handed over to Pulumi (Automation API) in the same process.
+# Only for the actions supported by run.py (see PULUMI_ACTIONS): any other one goes through the Pulumi CLI.
+INLINE_ACTIONS="^(preview|up|refresh|destroy)( --yes)?$"
+if [ "${SARI_INLINE:-}" = "true" ] && ! [[ "${PULUMI_ACTION:-preview}" =~ $INLINE_ACTIONS ]]; then
+    echo "Pulumi action not supported inline, falling back to the CLI: $PULUMI_ACTION"
+    SARI_INLINE=false
+fi
+if [ "${SARI_INLINE:-}" = "true" ]; then
+    SHARD_ARGS=""
+    for shard in ${SARI_SHARDS:-}; do
+        SHARD_ARGS="$SHARD_ARGS --shard=$shard"
+    done
+    exec ./run.py --stack=$PULUMI_STACK_NAME --purge-pulumi-stack $SHARD_ARGS ${PULUMI_ACTION:-preview}
+fi
+
+if [ -z "${SARI_SHARDS:-}" ]; then
+    pulumi --non-interactive stack select $PULUMI_STACK_NAME --create
+
+    ./build-model.py --model=$MODEL_JSON --purge-pulumi-stack $CHANGED_SHARDS_ARG
+
+    if [ -n "$CHANGED_SHARDS_ARG" ] && [ ! -s $CHANGED_SHARDS ]; then
+        echo "Nothing to update"
+        exit
+    fi
+    pulumi --non-interactive --logtostderr -v=${PULUMI_LOG_LEVEL:-2} ${PULUMI_ACTION:-preview}
+    if [[ "${PULUMI_ACTION:-}" == up* ]]; then
+        ./build-model.py --commit-changes
+    fi
+    exit
+fi
+
+# Sharded mode: SARI_SHARDS lists the shards (e.g. "iam mysql:eu-west-2 mysql:us-east-1"), each one updated
+# on its own stack (e.g. "$PULUMI_STACK_NAME.mysql.eu-west-2") in parallel, from the same model.
+declare -A SHARD_STACKS
+for shard in $SARI_SHARDS; do
+    SHARD_STACKS[$shard]=$PULUMI_STACK_NAME.${shard/:/.}
+    pulumi --non-interactive stack select ${SHARD_STACKS[$shard]} --create
+done
 
-./build-model.py --model=$MODEL_JSON --purge-pulumi-stack
+./build-model.py --model=$MODEL_JSON --purge-pulumi-stack ${SHARD_STACKS[@]/#/--pulumi-stack=} \
+    $CHANGED_SHARDS_ARG $(printf -- "--shard=%s " $SARI_SHARDS)
 
-pulumi --non-interactive --logtostderr -v=${PULUMI_LOG_LEVEL:-2} ${PULUMI_ACTION:-preview}
+SELECTED_SHARDS=$SARI_SHARDS
+if [ -n "$CHANGED_SHARDS_ARG" ]; then
+    SELECTED_SHARDS=$(cat $CHANGED_SHARDS)
+fi
+FAILED_SHARDS=""
+UPDATED_SHARDS=""
+# Runs the given shards in parallel, then waits for all of them.
+run_shards() {
+    declare -A SHARD_PIDS
+    for shard in "$@"; do
+        SARI_SHARD=$shard pulumi --non-interactive --logtostderr -v=${PULUMI_LOG_LEVEL:-2} \
+            --stack ${SHARD_STACKS[$shard]} ${PULUMI_ACTION:-preview} &
+        SHARD_PIDS[$shard]=$!
+    done
+    for shard in "${!SHARD_PIDS[@]}"; do
+        if wait ${SHARD_PIDS[$shard]}; then
+            UPDATED_SHARDS="$UPDATED_SHARDS $shard"
+        else
+            FAILED_SHARDS="$FAILED_SHARDS $shard"
+        fi
+    done
+}
+# The applications shards come last: they grant the roles declared by the mysql shards.
+run_shards $(printf "%s\n" $SELECTED_SHARDS | grep -v "^applications")
+run_shards $(printf "%s\n" $SELECTED_SHARDS | grep "^applications")
+# Each shard has its own snapshot of the model: the failed ones are still affected by the changes on the next run.
+if [[ "${PULUMI_ACTION:-}" == up* && -n "$UPDATED_SHARDS" ]]; then
+    ./build-model.py --commit-changes $(printf -- "--shard=%s " $UPDATED_SHARDS)
+fi
+if [ -n "$FAILED_SHARDS" ]; then
+    echo "Failed shards:$FAILED_SHARDS"
+    exit 1
+fi
@@ -1,26 +1,81 @@
 from datetime import datetime
-from functools import lru_cache
-from typing import List, Tuple, Set
+from threading import Lock, RLock
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import boto3
 from botocore.client import BaseClient
+from botocore.config import Config
 from configobj import ConfigObj
 
+# Limited by AWS. See https://docs.aws.amazon.com/systems-manager/latest/APIReference/API_GetParameters.html
+SSM_GET_PARAMETERS_MAX_NAMES = 10
+# Limited by AWS. See https://docs.aws.amazon.com/AmazonRDS/latest/APIReference/API_Filter.html
+RDS_FILTER_MAX_VALUES = 100
+
+# The connections kept open to each AWS service endpoint, shared by all threads. The default of botocore is 10.
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_RETRY_MODE = "adaptive"
+DEFAULT_MAX_ATTEMPTS = 5
+
 
 class AwsClient:
     _rds_known_endpoints: Set[str] = set()
+    # The S3 objects are fetched (and parsed) only once per run, whatever the region of the client. Being secrets,
+    # their properties are only kept in memory.
+    _s3_properties: Dict[Tuple[str, str], Tuple[dict, datetime]] = {}
+    _s3_locks: Dict[Tuple[str, str], Lock] = {}
+    _s3_locks_guard = Lock()
+    # The boto3 clients are created once per process, for each region and service, and shared by all AwsClients.
+    _session: Optional[boto3.session.Session] = None
+    _clients: Dict[Tuple[str, str], BaseClient] = {}
+    _clients_lock = RLock()
+    _client_config = Config(max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+                            retries={"mode": DEFAULT_RETRY_MODE, "total_max_attempts": DEFAULT_MAX_ATTEMPTS})
 
     def __init__(self, aws_region: str = None):
-        self._session = boto3.session.Session(region_name=aws_region)
-        self._clients = {}
+        self._region = aws_region or self._get_session().region_name
+
+    @classmethod
+    def configure(cls, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS, retry_mode: str = DEFAULT_RETRY_MODE,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        Set up the settings shared by all clients.
+
+        :param max_pool_connections: Maximum number of connections kept open to each AWS service (and region).
+        :param retry_mode: The retry mode of botocore: "legacy", "standard" or "adaptive" (client-side rate limited).
+        :param max_attempts: Maximum number of attempts of each request, including the first one.
+        """
+        with cls._clients_lock:
+            cls._client_config = Config(max_pool_connections=max_pool_connections,
+                                        retries={"mode": retry_mode, "total_max_attempts": max_attempts})
+            cls._clients = {}
 
     @classmethod
     def get_rds_known_endpoints(cls):
         return cls._rds_known_endpoints
 
+    @classmethod
+    def rds_discover_endpoints(cls, engine_type: str, endpoints: Iterable[str]) -> Set[str]:
+        """
+        Describe the instances behind the given endpoints that are not known yet, e.g. the ones no longer configured
+        when only the configured instances are enumerated.
+
+        :return: All the known endpoints, including the discovered ones.
+        """
+        db_ids: Dict[str, Set[str]] = {}
+        for endpoint in endpoints:
+            # e.g. "blackwells.c36k3kl10p4v.eu-west-1.rds.amazonaws.com:3306"
+            labels = endpoint.split(".")
+            if endpoint not in cls._rds_known_endpoints and len(labels) > 3 and labels[3] == "rds":
+                db_ids.setdefault(labels[2], set()).add(labels[0])
+        for region, region_db_ids in db_ids.items():
+            for _ in AwsClient(region).rds_enum_databases(engine_type, sorted(region_db_ids)):
+                pass
+        return cls._rds_known_endpoints
+
     @property
     def region(self):
-        return self._session.region_name
+        return self._region
 
     def get_account_id(self) -> str:
         """
@@ -29,32 +84,84 @@ class AwsClient:
         sts = self._get_client('sts')
         return sts.get_caller_identity()['Account']
 
-    def rds_enum_databases(self, engine_type: str) -> List[dict]:
+    def rds_enum_databases(self, engine_type: str, db_ids: Optional[List[str]] = None) -> Iterator[List[dict]]:
+        """
+        Enumerate all the RDS instances of an engine, as filtered by RDS.
+
+        :param db_ids: If given, only these instances are described (the ones that don't exist are just left out).
+        :return: The instances, page by page, as soon as each one is received.
+        """
         rds = self._get_client("rds")
         paginator = rds.get_paginator("describe_db_instances")
-        databases = []
-        for page in paginator.paginate(PaginationConfig={"MaxItems": 1000}):
-            databases.extend(db for db in page["DBInstances"] if db["Engine"] == engine_type)
-        try:
-            for db in databases:
-                self._rds_known_endpoints.add(f"{db['Endpoint']['Address']}:{db['Endpoint']['Port']}")
-        except KeyError:
-            pass
-        return databases
+        engine_filter = {"Name": "engine", "Values": [engine_type]}
+        if db_ids is None:
+            filters_list = [[engine_filter]]
+        else:
+            filters_list = [[engine_filter, {"Name": "db-instance-id",
+                                             "Values": db_ids[index:index + RDS_FILTER_MAX_VALUES]}]
+                            for index in range(0, len(db_ids), RDS_FILTER_MAX_VALUES)]
+        for page in (page for filters in filters_list for page in paginator.paginate(Filters=filters)):
+            databases = page["DBInstances"]
+            try:
+                for db in databases:
+                    self._rds_known_endpoints.add(f"{db['Endpoint']['Address']}:{db['Endpoint']['Port']}")
+            except KeyError:
+                pass
+            yield databases
 
     def ssm_get_encrypted_parameter(self, name) -> Tuple[str, datetime]:
         ssm = self._get_client('ssm')
         parameter = ssm.get_parameter(Name=name, WithDecryption=True)['Parameter']
         return parameter['Value'], parameter.get('LastModifiedDate', None)
 
+    def ssm_get_encrypted_parameters(self, names: List[str]) -> Dict[str, Optional[Tuple[str, datetime]]]:
+        """
+        Get many SSM parameters using the minimum number of requests.
+
+        :return: The value and the last modification date of each parameter, or None if it doesn't exist.
+        """
+        ssm = self._get_client('ssm')
+        parameters: Dict[str, Optional[Tuple[str, datetime]]] = {}
+        for index in range(0, len(names), SSM_GET_PARAMETERS_MAX_NAMES):
+            batch = names[index:index + SSM_GET_PARAMETERS_MAX_NAMES]
+            response = ssm.get_parameters(Names=batch, WithDecryption=True)
+            for parameter in response['Parameters']:
+                parameters[parameter['Name']] = parameter['Value'], parameter.get('LastModifiedDate', None)
+            for name in response['InvalidParameters']:
+                parameters[name] = None
+        return parameters
+
     def s3_get_property(self, bucket_name, key, property_name) -> Tuple[str, datetime]:
+        object_id = (bucket_name, key)
+        with self._s3_locks_guard:
+            lock = self._s3_locks.setdefault(object_id, Lock())
+        with lock:
+            if object_id not in self._s3_properties:
+                self._s3_properties[object_id] = self._s3_fetch_properties(bucket_name, key)
+        properties, last_modified = self._s3_properties[object_id]
+        return properties[property_name], last_modified
+
+    def _s3_fetch_properties(self, bucket_name, key) -> Tuple[dict, datetime]:
         s3 = self._get_client('s3')
         s3_object = s3.get_object(Bucket=bucket_name, Key=key)
         body = s3_object['Body'].read().decode("utf-8")
-        last_modified = s3_object['LastModified']
-        properties = ConfigObj(body.splitlines())
-        return properties[property_name], last_modified
+        return ConfigObj(body.splitlines()).dict(), s3_object['LastModified']
 
-    @lru_cache(maxsize=None)
     def _get_client(self, service_name) -> BaseClient:
-        return self._session.client(service_name)
+        key = (self._region, service_name)
+        client = self._clients.get(key)
+        if client is None:
+            # Creating the clients (and the session) is neither cheap nor thread-safe.
+            with self._clients_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._get_session().client(service_name, region_name=self._region,
+                                                                             config=self._client_config)
+        return client
+
+    @classmethod
+    def _get_session(cls) -> boto3.session.Session:
+        with cls._clients_lock:
+            if cls._session is None:
+                cls._session = boto3.session.Session()
+            return cls._session
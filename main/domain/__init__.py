@@ -1,4 +1,10 @@
 from .dbstatus import DbStatus
+from .grant_mode import GrantMode
+from .permission import (
+    Permission,
+    compact_permissions,
+    encode_permission,
+)
 
 from .issue import (
     IssueLevel,
@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+class GrantMode(Enum):
+    """How the privileges are granted to the users (`grant_mode` in custom.yaml)."""
+    # Directly, with a Grant resource per user, database and db_name
+    USER = "user"
+    # By membership of a (MySQL 8) role per database, db_name and grant type
+    ROLE = "role"
@@ -0,0 +1,75 @@
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Tuple
+
+
+class Permission:
+    """
+    The grant type of a user on some schemas (db_names) of a database.
+
+    The same permission is usually given to many users on many databases, and referenced from both the user and the
+    database: use `Permission.of()` to share a single (immutable) instance of each one. It's read like the dict
+    it replaces (`permission.grant_type` or `permission["grant_type"]`), and serialized as such (see `to_dict()`).
+    """
+    __slots__ = ("db_names", "grant_type")
+
+    _instances: Dict[Tuple[Tuple[str, ...], str], "Permission"] = {}
+
+    def __init__(self, db_names: Iterable[str], grant_type: str):
+        object.__setattr__(self, "db_names", tuple(sys.intern(db_name) for db_name in db_names))
+        object.__setattr__(self, "grant_type", sys.intern(grant_type))
+
+    @classmethod
+    def of(cls, db_names: Iterable[str], grant_type: str) -> "Permission":
+        permission = cls(db_names, grant_type)
+        return cls._instances.setdefault((permission.db_names, permission.grant_type), permission)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"db_names": list(self.db_names), "grant_type": self.grant_type}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setattr__(self, key: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # Immutable: pickled (or copied) by its arguments, and restored as the shared instance.
+        return Permission.of, (self.db_names, self.grant_type)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Permission):
+            return self.db_names == other.db_names and self.grant_type == other.grant_type
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.db_names, self.grant_type))
+
+    def __repr__(self) -> str:
+        return f"Permission(db_names={list(self.db_names)!r}, grant_type={self.grant_type!r})"
+
+
+def compact_permissions(model: Any) -> Any:
+    """Replaces the permissions of the users and the databases of a (deserialized) model by shared `Permission`s."""
+    for entries in ((model.get("okta") or {}).get("users") or {}, (model.get("aws") or {}).get("databases") or {}):
+        for entry in entries.values():
+            permissions = entry.get("permissions")
+            if permissions:
+                entry["permissions"] = {sys.intern(key): Permission.of(permission["db_names"],
+                                                                       permission["grant_type"])
+                                        for key, permission in permissions.items()}
+    return model
+
+
+def encode_permission(value: Any) -> Any:
+    """Serializes the `Permission`s of the model as plain dicts, e.g. as `on_unknown` handler of `bson.dumps()`."""
+    if isinstance(value, Permission):
+        return value.to_dict()
+    raise TypeError(f"Unable to serialize {type(value).__name__}")
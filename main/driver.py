@@ -0,0 +1,83 @@
+from typing import Callable, Iterable, Optional
+
+from loguru import logger
+from prodict import Prodict
+from pulumi.x import automation as auto
+
+from main.aws_client import AwsClient
+from main.updater import ALL_SHARDS, ModelChanges, Updater, sort_shards
+from main.gatherer.dbinfo import ENGINE_TYPE
+from main.util import get_mysql_provider_endpoints, purge_pulumi_stack
+
+# Same as in Pulumi.yaml
+PULUMI_PROJECT_NAME = "sari"
+
+PULUMI_ACTIONS = ("preview", "up", "refresh", "destroy")
+# The actions skipped when the model is unchanged: the other ones act on the live resources, whatever the model.
+MODEL_CHANGES_ACTIONS = ("preview", "up")
+
+
+def run_pulumi(model: Prodict, stack_name: str, action: str, shards: Iterable[str] = (), purge: bool = False,
+               model_changes: Optional[ModelChanges] = None, on_output: Callable[[str], None] = print):
+    """
+    Runs the Updater on the given model as an inline Pulumi program, i.e. without leaving the current process.
+
+    :param stack_name: The Pulumi stack. With shards, the base name of their stacks (see `shard_stack_name()`).
+    :param action: One of `PULUMI_ACTIONS`.
+    :param shards: If any, each one is updated on its own stack (one after the other, in the order of their phases:
+     the Pulumi runtime settings are global to the process).
+    :param purge: Purge zombie resources from the stack(s) beforehand (see `purge_pulumi_stack()`).
+    :param model_changes: If set (and the action is one of `MODEL_CHANGES_ACTIONS`), only the shards affected by
+     the model changes are updated, and the model is recorded as applied to each one once it's up.
+    :raises auto.CommandError: If Pulumi fails.
+    """
+    if action not in PULUMI_ACTIONS:
+        raise ValueError(f"Unsupported Pulumi action: {action}")
+    shards = list(shards)
+    if action not in MODEL_CHANGES_ACTIONS:
+        model_changes = None
+    if model_changes:
+        shards = model_changes.select_shards(model, shards)
+        if not shards:
+            logger.info("Nothing to update")
+            return
+    stacks = {shard_stack_name(stack_name, shard): shard
+              for shard in sort_shards(shard for shard in shards if shard != ALL_SHARDS)} \
+        or {stack_name: None}
+    for name, shard in stacks.items():
+        stack = auto.create_or_select_stack(name,
+                                            project_name=PULUMI_PROJECT_NAME,
+                                            program=_updater_program(model, shard),
+                                            opts=auto.LocalWorkspaceOptions(work_dir="."))
+        if purge:
+            purge_stack(stack)
+        logger.info(f"Running Pulumi {action} on stack {name}")
+        getattr(stack, action)(on_output=on_output)
+        if model_changes and action == "up":
+            model_changes.commit([shard or ALL_SHARDS])
+
+
+def shard_stack_name(stack_name: str, shard: str) -> str:
+    """The stack of a shard, e.g. `acme.mysql.eu-west-2` for the `mysql:eu-west-2` shard of `acme`."""
+    return f"{stack_name}.{shard.replace(':', '.')}"
+
+
+def purge_stack(stack: auto.Stack):
+    deployment = stack.export_stack()
+    original_stack = {"version": deployment.version, "deployment": deployment.deployment}
+    # The instances not enumerated (e.g. no longer configured) may still be alive.
+    live_rds_endpoints = AwsClient.rds_discover_endpoints(ENGINE_TYPE, get_mysql_provider_endpoints(original_stack))
+    updated_stack, num_changes = purge_pulumi_stack(original_stack, live_rds_endpoints)
+    if num_changes > 0:
+        logger.info(f"Purging {num_changes} resources from Pulumi Stack {stack.name}")
+        stack.import_stack(auto.Deployment(**updated_stack))
+
+
+def _updater_program(model: Prodict, shard: Optional[str]) -> Callable[[], None]:
+    def program():
+        if shard:
+            Updater(model).update_shard(shard)
+        else:
+            Updater(model).update_all()
+
+    return program
@@ -8,6 +8,9 @@ from .gatherer import Gatherer
 
 
 class AwsGatherer(Gatherer):
+    reads = ()
+    writes = ("aws.account",)
+
     def __init__(self, aws: AwsClient):
         self.aws = aws
 
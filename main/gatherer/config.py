@@ -7,8 +7,8 @@ import pytz
 import yaml
 from prodict import Prodict
 
-from main.domain import DbStatus, Issue, IssueLevel
-from main.util import wc_expand
+from main.domain import DbStatus, Issue, IssueLevel, Permission
+from main.util import Reference, WildcardIndex
 from .gatherer import Gatherer
 from .pwd_resolver import MasterPasswordResolver
 
@@ -18,6 +18,9 @@ DEFAULT_GRANT_TYPE = 'query'
 
 
 class UserConfigGatherer(Gatherer):
+    reads = ("aws.databases", "aws.single_region", "job")
+    writes = ("okta.users", "okta.groups", "aws.databases", "job")
+
     def __init__(self, cfg_stream: Union[str, StringIO], time_ref: datetime = None):
         """
         :param cfg_stream: Path of Yaml file containing users definition.
@@ -39,11 +42,19 @@ class UserConfigGatherer(Gatherer):
             users_list: List[dict] = yaml.safe_load(stream) or []
         default_db_name = {db_uid: db.db_name for db_uid, db in model.aws.databases.items()
                            if DbStatus[db.status] >= DbStatus.ENABLED}
-        enabled_databases = list(default_db_name.keys())
+        enabled_databases = WildcardIndex(default_db_name.keys(), _get_tags(model))
         users = {}
+        groups = {}
         databases = {}
-        for user in users_list:
-            login = user["login"]
+        for index, user in enumerate(users_list):
+            # An Okta group grants the same permissions to all its members.
+            is_group = "group" in user
+            if is_group == ("login" in user):
+                issues.append(Issue(level=IssueLevel.ERROR, type="USER",
+                                    id=user.get("login", f"#{index + 1}"),
+                                    message="Expected exactly one of 'login' and 'group'"))
+                continue
+            login = user["group"] if is_group else user["login"]
             default_grant_type = user.get("default_grant_type", DEFAULT_GRANT_TYPE)
             try:
                 permissions = self._parse_permissions(
@@ -52,6 +63,9 @@ class UserConfigGatherer(Gatherer):
                     default_grant_type,
                     enabled_databases,
                     default_db_name)
+                if is_group:
+                    groups[login] = {"permissions": permissions}
+                    continue
                 users[login] = {
                     "db_username": login[:MAX_DB_USERNAME_LENGTH],
                     "permissions": permissions
@@ -59,8 +73,11 @@ class UserConfigGatherer(Gatherer):
                 for db_uid, grant_type in permissions.items():
                     databases.setdefault(db_uid, {"permissions": {}})["permissions"][login] = grant_type
             except ValueError as e:
-                issues.append(Issue(level=IssueLevel.ERROR, type='USER', id=login, message=str(e)))
+                issues.append(Issue(level=IssueLevel.ERROR, type=('GROUP' if is_group else 'USER'), id=login,
+                                    message=str(e)))
         updates = Prodict(okta={"users": users}, aws={"databases": databases})
+        if groups:
+            updates.okta.groups = groups
         if self._next_transition:
             updates.job = dict(next_transition=self._next_transition)
         return updates, issues
@@ -68,14 +85,14 @@ class UserConfigGatherer(Gatherer):
     def _parse_permissions(self, perm_list: List[dict],
                            default_region: Optional[str],
                            default_grant_type: str,
-                           db_ids: List[str],
-                           default_db_name: Dict[str, dict]) -> Dict[str, dict]:
-        permissions: Dict[str, dict] = {}
+                           db_ids: WildcardIndex,
+                           default_db_name: Dict[str, dict]) -> Dict[str, Permission]:
+        permissions: Dict[str, Permission] = {}
         for perm in perm_list:
             db_ref = perm['db']
-            if "/" not in db_ref and default_region:
-                db_ref = f"{default_region}/{db_ref}"
-            db_id_list = wc_expand(db_ref, db_ids)
+            if default_region:
+                db_ref = _with_default_region(db_ref, default_region)
+            db_id_list = db_ids.expand(db_ref)
             if not db_id_list:
                 raise ValueError(f"Not existing and enabled DB instance reference '{db_ref}'")
             not_valid_before = _check_dt(perm, "not_valid_before")
@@ -97,10 +114,7 @@ class UserConfigGatherer(Gatherer):
                         self._set_next_transition(not_valid_after)
             if grant_type != "none":
                 for db_uid in db_id_list:
-                    permissions[db_uid] = dict(
-                        db_names=(db_names or [default_db_name[db_uid]]),
-                        grant_type=grant_type
-                    )
+                    permissions[db_uid] = Permission.of(db_names or [default_db_name[db_uid]], grant_type)
         return permissions
 
     def _set_next_transition(self, dt: datetime):
@@ -109,6 +123,8 @@ class UserConfigGatherer(Gatherer):
 
 
 class DatabaseConfigGatherer(Gatherer):
+    reads = ()
+
     def __init__(self, region: str, cfg_filename: str, pwd_resolver: MasterPasswordResolver):
         """
         :param region: AWS region name.
@@ -117,11 +133,14 @@ class DatabaseConfigGatherer(Gatherer):
         self.region = region
         self.cfg_filename = cfg_filename
         self.pwd_resolver = pwd_resolver
+        self.writes = (f"aws.databases.{region}",)
 
     # noinspection PyUnusedLocal
     def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
         with open(self.cfg_filename) as file:
             rds_list: List[dict] = yaml.safe_load(file)
+        self.pwd_resolver.prefetch((cfg_db["id"], cfg_db.get("master_password")) for cfg_db in rds_list
+                                   if _to_bool(cfg_db.get("enabled", True)))
         issues = []
         databases = {}
         for cfg_db in rds_list:
@@ -147,6 +166,9 @@ class DatabaseConfigGatherer(Gatherer):
 
 
 class ServiceConfigGatherer(Gatherer):
+    reads = ("aws.databases",)
+    writes = ("aws.glue_connections",)
+
     def __init__(self, cfg_filename: str):
         self.cfg_filename = cfg_filename
 
@@ -155,13 +177,13 @@ class ServiceConfigGatherer(Gatherer):
         updates = {}
         with open(self.cfg_filename) as file:
             services = yaml.safe_load(file)
-        enabled_databases = [db_uid for db_uid, db in model.aws.databases.items()
-                             if DbStatus[db.status] >= DbStatus.ENABLED]
+        enabled_databases = WildcardIndex((db_uid for db_uid, db in model.aws.databases.items()
+                                           if DbStatus[db.status] >= DbStatus.ENABLED), _get_tags(model))
         for conn in services.get("glue_connections", []):
             db_ref = conn['db']
-            db_id_list = wc_expand(db_ref, enabled_databases)
+            db_id_list = enabled_databases.expand(db_ref)
             if not db_id_list:
-                issues.append(Issue(level=IssueLevel.ERROR, type='GLUE', id=db_ref,
+                issues.append(Issue(level=IssueLevel.ERROR, type='GLUE', id=str(db_ref),
                                     message=f"Not existing and enabled DB instance reference '{db_ref}'"))
                 continue
             pcr = conn.get("physical_connection_requirements", {})
@@ -184,6 +206,9 @@ class ServiceConfigGatherer(Gatherer):
 
 
 class ApplicationConfigGatherer(Gatherer):
+    reads = ("aws.databases",)
+    writes = ("applications",)
+
     def __init__(self, cfg_filename: str):
         self.cfg_filename = cfg_filename
 
@@ -192,12 +217,12 @@ class ApplicationConfigGatherer(Gatherer):
         updates = {}
         with open(self.cfg_filename) as file:
             applications: List[dict] = yaml.safe_load(file)
-        enabled_databases = [db_uid for db_uid, db in model.aws.databases.items()
-                             if DbStatus[db.status] >= DbStatus.ENABLED]
+        enabled_databases = WildcardIndex((db_uid for db_uid, db in model.aws.databases.items()
+                                           if DbStatus[db.status] >= DbStatus.ENABLED), _get_tags(model))
         for app in applications:
             app_name = app['name']
             db_ref = app['db']
-            db_id_list = wc_expand(db_ref, enabled_databases)
+            db_id_list = enabled_databases.expand(db_ref)
             if not db_id_list:
                 issues.append(Issue(level=IssueLevel.ERROR, type='APP', id=app_name,
                                     message=f"Not existing and enabled DB instance reference '{db_ref}'"))
@@ -206,6 +231,16 @@ class ApplicationConfigGatherer(Gatherer):
         return Prodict(applications=updates), issues
 
 
+def _with_default_region(db_ref: Reference, default_region: str) -> Reference:
+    if isinstance(db_ref, dict):
+        return dict(db_ref, id=_with_default_region(db_ref["id"], default_region)) if "id" in db_ref else db_ref
+    return db_ref if "/" in db_ref else f"{default_region}/{db_ref}"
+
+
+def _get_tags(model: Prodict) -> Dict[str, Dict[str, str]]:
+    return {db_uid: db.tags for db_uid, db in model.aws.databases.items() if db.get("tags")}
+
+
 def _open(stream):
     if isinstance(stream, str):
         return open(stream, "r")
@@ -11,9 +11,15 @@ ENGINE_TYPE = "mysql"
 
 
 class DatabaseInfoGatherer(Gatherer):
-    def __init__(self, aws: AwsClient, pwd_resolver: MasterPasswordResolver):
+    def __init__(self, aws: AwsClient, pwd_resolver: MasterPasswordResolver, auto_enable: bool = True):
+        """
+        :param auto_enable: Enable the (MySQL) instances not configured. Otherwise, only the configured instances are
+         described, instead of all of them.
+        """
         self.aws = aws
         self.pwd_resolver = pwd_resolver
+        self.auto_enable = auto_enable
+        self.reads = self.writes = (f"aws.databases.{aws.region}",)
 
     def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
         issues = []
@@ -21,7 +27,19 @@ class DatabaseInfoGatherer(Gatherer):
         not_found = dict(status=DbStatus.ABSENT.name)
         updates = {db_uid: not_found for db_uid in configured_databases
                    if db_uid.startswith(f"{self.aws.region}/")}
-        for db in self.aws.rds_enum_databases(ENGINE_TYPE):
+        db_ids = None if self.auto_enable else [db_uid.split("/", 1)[1] for db_uid in updates]
+        for rds_databases in self.aws.rds_enum_databases(ENGINE_TYPE, db_ids):
+            self._gather_page(rds_databases, configured_databases, updates, issues)
+        for db_uid, db in updates.items():
+            if db == not_found:
+                issues.append(Issue(level=IssueLevel.ERROR, type="DB", id=db_uid, message="Not found in AWS"))
+        return Prodict(aws={"databases": updates}), issues
+
+    def _gather_page(self, rds_databases: List[dict], configured_databases: Dict[str, Prodict],
+                     updates: Dict[str, dict], issues: List[Issue]):
+        self.pwd_resolver.prefetch((db["DBInstanceIdentifier"], None) for db in rds_databases
+                                   if f"{self.aws.region}/{db['DBInstanceIdentifier']}" not in configured_databases)
+        for db in rds_databases:
             db_id = db["DBInstanceIdentifier"]
             db_uid = f"{self.aws.region}/{db_id}"
             if db_uid not in configured_databases:
@@ -60,11 +78,11 @@ class DatabaseInfoGatherer(Gatherer):
                                            if sg["Status"] == "active"],
                 "primary_subnet": subnets_by_az[az][0]
             })
+            # For the selectors by tags (see `WildcardIndex`)
+            tags = {tag["Key"]: tag["Value"] for tag in db.get("TagList") or []}
+            if tags:
+                db_upd["tags"] = tags
             updates[db_uid] = db_upd
-        for db_uid, db in updates.items():
-            if db == not_found:
-                issues.append(Issue(level=IssueLevel.ERROR, type="DB", id=db_uid, message="Not found in AWS"))
-        return Prodict(aws={"databases": updates}), issues
 
 
 def _get_subnets_by_az(db) -> Dict[str, List[str]]:
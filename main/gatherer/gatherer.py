@@ -5,8 +5,17 @@ from prodict import Prodict
 
 from main.domain import Issue
 
+# The empty path denotes the whole model.
+WHOLE_MODEL = ""
+
 
 class Gatherer:
+    # Dotted paths of the model keys consulted and updated by `gather()`. ModelBuilder relies on them to find out which
+    # gatherers may run concurrently. The databases may be scoped by region (e.g. `aws.databases.eu-west-2`).
+    # The defaults are the safest (yet serializing) choice.
+    reads: Tuple[str, ...] = (WHOLE_MODEL,)
+    writes: Tuple[str, ...] = (WHOLE_MODEL,)
+
     @abc.abstractmethod
     def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
         pass
@@ -0,0 +1,157 @@
+import asyncio
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from prodict import Prodict
+
+from main.domain import DbStatus, GrantMode, Issue, IssueLevel
+from main.util import SocketFactory
+from .gatherer import Gatherer
+from .mysql import MYSQL_LOGIN_TIMEOUT, MYSQL_MAX_CONCURRENT_PROBES, ProbeResult, connect_instance, probe_all
+
+# The users provisioned by SARI are the only ones authenticated by IAM.
+# See https://docs.aws.amazon.com/AmazonRDS/latest/UserGuide/UsingWithRDS.IAMDBAuth.DBAccounts.html
+SARI_MANAGED_GRANTS_QUERY = """
+SELECT u.User, p.TABLE_SCHEMA, p.PRIVILEGE_TYPE
+  FROM mysql.user u
+  LEFT JOIN information_schema.SCHEMA_PRIVILEGES p
+    ON p.GRANTEE = CONCAT('''', u.User, '''@''', u.Host, '''')
+ WHERE u.plugin = 'AWSAuthenticationPlugin' AND u.Host = '%'
+"""
+
+# Same as above, but including the privileges of the (MySQL 8) roles granted to the users.
+SARI_MANAGED_ROLE_GRANTS_QUERY = """
+SELECT u.User, p.TABLE_SCHEMA, p.PRIVILEGE_TYPE
+  FROM mysql.user u
+  LEFT JOIN mysql.role_edges r
+    ON r.TO_USER = u.User AND r.TO_HOST = u.Host
+  LEFT JOIN information_schema.SCHEMA_PRIVILEGES p
+    ON p.GRANTEE IN (CONCAT('''', u.User, '''@''', u.Host, ''''),
+                     CONCAT('''', r.FROM_USER, '''@''', r.FROM_HOST, ''''))
+ WHERE u.plugin = 'AWSAuthenticationPlugin' AND u.Host = '%'
+"""
+
+# The privileges `ALL [PRIVILEGES]` stands for at the database level, as listed by `SCHEMA_PRIVILEGES`.
+# See https://dev.mysql.com/doc/refman/8.0/en/privileges-provided.html
+ALL_SCHEMA_PRIVILEGES = (
+    "ALTER", "ALTER ROUTINE", "CREATE", "CREATE ROUTINE", "CREATE TEMPORARY TABLES", "CREATE VIEW", "DELETE", "DROP",
+    "EVENT", "EXECUTE", "INDEX", "INSERT", "LOCK TABLES", "REFERENCES", "SELECT", "SHOW VIEW", "TRIGGER", "UPDATE",
+)
+
+# login -> db_name -> privileges (sorted)
+Grants = Dict[str, Dict[str, List[str]]]
+
+
+class MySqlGrantsGatherer(Gatherer):
+    reads = ("aws.databases", "okta.users", "custom")
+    writes = ("aws.databases",)
+
+    def __init__(self, socket_factory: Optional[SocketFactory] = None,
+                 max_concurrency: int = MYSQL_MAX_CONCURRENT_PROBES, deadline: float = MYSQL_LOGIN_TIMEOUT):
+        """
+        :param socket_factory: Creates the connections to the instances, if not directly.
+        :param max_concurrency: Maximum number of instances queried at the same time.
+        :param deadline: Maximum duration (in seconds) of each query.
+        """
+        self.socket_factory = socket_factory
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+
+    def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
+        """
+        For all accessible RDS instances: read the grants of the SARI-managed users, and compare them with the
+        grants expected from the configuration. Users with different grants are reported as drifted, while the ones
+        not configured at all (anymore) are reported as orphaned.
+        """
+        grant_types = model.custom.get("grant_types") or model.grant_types
+        query = SARI_MANAGED_ROLE_GRANTS_QUERY if model.custom.get("grant_mode") == GrantMode.ROLE.value \
+            else SARI_MANAGED_GRANTS_QUERY
+        databases = {db_uid: db for db_uid, db in model.aws.databases.items()
+                     if DbStatus[db.status] >= DbStatus.ACCESSIBLE}
+        logger.info("Checking grants of RDS instances:")
+
+        issues = []
+        db_id_max_len = max(map(len, databases), default=0)
+        updates = {}
+
+        def report(db_uid: str, result: ProbeResult):
+            success, live_grants = result
+            leader = "." * (2 + db_id_max_len - len(db_uid))
+            if not success:
+                issues.append(Issue(level=IssueLevel.WARNING, type="DB", id=db_uid,
+                                    message=f"Unable to read the grants: {live_grants}"))
+                logger.opt(colors=True).info(f"  {db_uid} {leader} <red>{live_grants}</red>")
+                return
+            expected_grants = get_expected_grants(databases[db_uid], model.okta.users, grant_types)
+            drift = sorted(login for login, grants in expected_grants.items() if live_grants.get(login) != grants)
+            orphaned = sorted(set(live_grants) - set(expected_grants))
+            for login in drift:
+                issues.append(Issue(level=IssueLevel.WARNING, type="GRANT", id=f"{db_uid}/{login}",
+                                    message=f"Drifted: expected {expected_grants[login]}, "
+                                            f"found {live_grants.get(login, 'NONE')}"))
+            for login in orphaned:
+                issues.append(Issue(level=IssueLevel.WARNING, type="GRANT", id=f"{db_uid}/{login}",
+                                    message="Orphaned SARI-managed user"))
+            updates[db_uid] = dict(live_grants=live_grants, grant_drift=drift, orphaned_users=orphaned)
+            if drift or orphaned:
+                message = f"DRIFTED ({len(drift)}), ORPHANED ({len(orphaned)})"
+                color = "yellow"
+            else:
+                message = "IN SYNC"
+                color = "green"
+            logger.opt(colors=True).info(f"  {db_uid} {leader} <{color}>{message}</{color}>")
+
+        probe = partial(_read_grants, query=query, socket_factory=self.socket_factory, timeout=self.deadline)
+        asyncio.run(probe_all(databases, probe, report, self.max_concurrency, self.deadline))
+        return Prodict(aws={"databases": updates}), issues
+
+
+def get_expected_grants(db: Prodict, okta_users: Dict[str, Prodict], grant_types: Dict[str, List[str]]) -> Grants:
+    """The grants of the database that are provisioned for the active users (see `Updater.update_mysql()`)."""
+    expected = {}
+    for login, permission in (db.get("permissions") or {}).items():
+        user = okta_users.get(login)
+        if user and user.get("status") == "ACTIVE":
+            privileges = normalize_privileges(grant_types[permission["grant_type"]])
+            expected[login] = {db_name: privileges for db_name in permission["db_names"]}
+    return expected
+
+
+def normalize_privileges(privileges: Iterable[str]) -> List[str]:
+    """The individual privileges, as listed by `SCHEMA_PRIVILEGES`, given the ones of a grant type (e.g. `all`)."""
+    normalized = set()
+    for privilege in privileges:
+        privilege = " ".join(privilege.upper().split())
+        if privilege in ("ALL", "ALL PRIVILEGES"):
+            normalized.update(ALL_SCHEMA_PRIVILEGES)
+        else:
+            normalized.add(privilege)
+    return sorted(normalized)
+
+
+def to_grants(rows: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> Grants:
+    """Groups the rows of `SARI_MANAGED_GRANTS_QUERY` (or its role-aware version)."""
+    grants = {}
+    for login, db_name, privilege in rows:
+        user_grants = grants.setdefault(login, {})
+        if db_name:
+            user_grants.setdefault(db_name, set()).add(privilege)
+    return {login: {db_name: sorted(privileges) for db_name, privileges in user_grants.items()}
+            for login, user_grants in grants.items()}
+
+
+def _read_grants(db, query: str = SARI_MANAGED_GRANTS_QUERY, socket_factory: Optional[SocketFactory] = None,
+                 timeout: float = MYSQL_LOGIN_TIMEOUT) -> ProbeResult:
+    connection = connect_instance(db, socket_factory, timeout)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query)
+        return True, to_grants((_to_str(login), _to_str(db_name), _to_str(privilege))
+                               for login, db_name, privilege in cursor.fetchall())
+    finally:
+        connection.close()
+
+
+def _to_str(value) -> Optional[str]:
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
@@ -1,43 +1,62 @@
 import glob
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional
 from typing import Tuple
 
 import yaml
 from prodict import Prodict
 
-from main.aws_client import AwsClient
+from main.aws_client import DEFAULT_MAX_ATTEMPTS, DEFAULT_MAX_POOL_CONNECTIONS, DEFAULT_RETRY_MODE, AwsClient
 from main.domain import Issue
-from main.util import dict_deep_merge
+from main.util import SshTunnel, dict_deep_merge, load_private_key, socks_socket_factory
 from .aws import AwsGatherer
-from .config import DatabaseConfigGatherer, UserConfigGatherer, ServiceConfigGatherer, ApplicationConfigGatherer
-from .dbinfo import DatabaseInfoGatherer
+from .config import UserConfigGatherer, ServiceConfigGatherer, ApplicationConfigGatherer
 from .gatherer import Gatherer
-from .mysql import MySqlGatherer
-from .okta import OktaGatherer
+from .grants import MySqlGrantsGatherer
+from .mysql import MYSQL_MAX_CONCURRENT_PROBES, MySqlGatherer
+from .okta import OktaGatherer, OktaGroupGatherer
 from .pwd_resolver import MasterPasswordResolver
+from .region import RegionGatherer, get_region_gatherers
+from .scheduler import schedule_gatherers
 
 
 class ModelBuilder:
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, trace_provenance: bool = False):
+        """
+        :param max_workers: Maximum number of gatherers running concurrently.
+        :param trace_provenance: Record which gatherer set each value of the model (see `provenance`).
+        """
         self.model = initial_model()
         self.issues = []
+        self.max_workers = max_workers
+        # path of a value (as the tuple of its keys) -> the (class) name of the gatherer that set it
+        self.provenance: Optional[Dict[Tuple[str, ...], str]] = {} if trace_provenance else None
 
     def build(self) -> Tuple[Prodict, List[Issue]]:
-        all_issues: List[Issue] = []
-
+        # The custom configuration is required to set up the remaining gatherers.
         self.apply_gatherer(CustomGatherer())
-        gatherers = get_all_gatherers(self.model)
-        for gatherer in gatherers:
-            self.apply_gatherer(gatherer)
-
-        return self.model, all_issues
+        with ExitStack() as resources:
+            gatherers = get_all_gatherers(self.model, resources)
+            with ThreadPoolExecutor(self.max_workers, thread_name_prefix="gatherer") as executor:
+                for wave in schedule_gatherers(gatherers):
+                    futures = [executor.submit(gatherer.gather, self.model) for gatherer in wave]
+                    # The model is only updated once the whole wave is over, as its gatherers are reading it.
+                    results = [future.result() for future in futures]
+                    # Merging in the original order makes the result deterministic.
+                    for gatherer, result in zip(wave, results):
+                        self.merge_updates(*result, source=type(gatherer).__name__)
+
+        return self.model, self.issues
 
     def apply_gatherer(self, gatherer: Gatherer):
-        updates, issues = gatherer.gather(self.model)
+        self.merge_updates(*gatherer.gather(self.model), source=type(gatherer).__name__)
+
+    def merge_updates(self, updates: Prodict, issues: List[Issue], source: Optional[str] = None):
         self.issues.extend(issues)
-        dict_deep_merge(self.model, updates)
+        dict_deep_merge(self.model, updates, provenance=self.provenance, source=source)
 
 
 def initial_model() -> Prodict:
@@ -47,6 +66,17 @@ def initial_model() -> Prodict:
         system={
             "config_dir": config_dir,
             "proxy": os.environ.get("PROXY"),
+            "ssh_tunnel": os.environ.get("SARI_SSH_TUNNEL") == "true",
+            "check_grants": os.environ.get("SARI_CHECK_GRANTS") == "true",
+            "lazy_secrets": os.environ.get("SARI_LAZY_SECRETS") == "true",
+            "region_processes": int(os.environ.get("SARI_REGION_PROCESSES", 0)),
+            "cache_dir": os.environ.get("SARI_CACHE_DIR"),
+            "aws_max_pool_connections": int(os.environ.get("SARI_AWS_MAX_POOL_CONNECTIONS",
+                                                           DEFAULT_MAX_POOL_CONNECTIONS)),
+            "aws_retry_mode": os.environ.get("SARI_AWS_RETRY_MODE", DEFAULT_RETRY_MODE),
+            "aws_max_attempts": int(os.environ.get("SARI_AWS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+            "okta_bulk_size": int(os.environ.get("SARI_OKTA_BULK_SIZE", 0)),
+            "mysql_max_probes": int(os.environ.get("SARI_MYSQL_MAX_PROBES", MYSQL_MAX_CONCURRENT_PROBES)),
         },
         aws={
             "regions": regions,
@@ -93,16 +123,32 @@ def discover_regions(basedir: str) -> List[str]:
     return regions
 
 
-def get_all_gatherers(model: Prodict) -> List[Gatherer]:
+def get_all_gatherers(model: Prodict, resources: ExitStack) -> List[Gatherer]:
+    """
+    :param resources: Where the resources shared by the gatherers (executors, SSH tunnel) are registered, to be
+     released once all of them are over.
+    """
     config_dir = model.system.config_dir
-    executor = ThreadPoolExecutor()
-    gatherers: List[Gatherer] = [CustomGatherer(), AwsGatherer(AwsClient())]
+    aws_settings = get_aws_settings(model)
+    AwsClient.configure(**aws_settings)
+    executor = resources.enter_context(ThreadPoolExecutor())
+    gatherers: List[Gatherer] = [AwsGatherer(AwsClient())]
+    region_executor = None
+    if model.system.region_processes:
+        # Each region is gathered on its own process so the CPU-bound work is not limited by the GIL.
+        region_executor = resources.enter_context(
+            ProcessPoolExecutor(model.system.region_processes, mp_context=get_context("spawn")))
     for region in model.aws.regions:
-        aws_client = AwsClient(region)
-        pwd_resolver = MasterPasswordResolver(aws_client, model.custom.master_password_defaults)
-        gatherers.append(DatabaseConfigGatherer(region, f"{config_dir}/{region}/databases.yaml", pwd_resolver))
-        gatherers.append(DatabaseInfoGatherer(aws_client, pwd_resolver))
-    gatherers.append(MySqlGatherer(executor, model.system.proxy))
+        cfg_filename = f"{config_dir}/{region}/databases.yaml"
+        auto_enable = is_auto_enabled(model, region)
+        if region_executor:
+            gatherers.append(RegionGatherer(region, cfg_filename, model.custom.master_password_defaults,
+                                            aws_settings, region_executor, model.system.lazy_secrets, auto_enable))
+        else:
+            aws_client = AwsClient(region)
+            pwd_resolver = MasterPasswordResolver(aws_client, model.custom.master_password_defaults,
+                                                  lazy=model.system.lazy_secrets)
+            gatherers.extend(get_region_gatherers(region, cfg_filename, aws_client, pwd_resolver, auto_enable))
     gatherers.append(UserConfigGatherer(f"{config_dir}/users.yaml"))
     services_yaml = f"{config_dir}/services.yaml"
     if os.path.exists(services_yaml):
@@ -110,12 +156,58 @@ def get_all_gatherers(model: Prodict) -> List[Gatherer]:
     applications_yaml = f"{config_dir}/applications.yaml"
     if os.path.exists(applications_yaml):
         gatherers.append(ApplicationConfigGatherer(applications_yaml))
-    okta_gatherer = OktaGatherer(model.okta.api_token, executor)
+    gatherers.append(OktaGroupGatherer(model.okta.api_token, executor))
+    okta_gatherer = OktaGatherer(model.okta.api_token, executor, model.system.okta_bulk_size,
+                                 model.system.cache_dir)
     gatherers.append(okta_gatherer)
+    # The probes go through the bastion host, either via the SOCKS proxy or an SSH tunnel of our own.
+    if model.system.ssh_tunnel:
+        socket_factory = resources.enter_context(get_ssh_tunnel(model)).create_connection
+    else:
+        socket_factory = socks_socket_factory(model.system.proxy) if model.system.proxy else None
+    # The probes come after the configuration gatherers, which don't depend on the accessibility of the instances
+    # (only on them being enabled), so they're run along with the Okta users fetch rather than before everything else.
+    gatherers.append(MySqlGatherer(model.system.proxy, model.system.mysql_max_probes, socket_factory=socket_factory))
+    if model.system.check_grants:
+        gatherers.append(MySqlGrantsGatherer(socket_factory, model.system.mysql_max_probes))
     return gatherers
 
 
+def is_auto_enabled(model: Prodict, region: str) -> bool:
+    """
+    Whether the unconfigured instances of the region are enabled, as set by `auto_enable` in custom.yaml: either for
+    all regions (`auto_enable: false`), or by region (`auto_enable: {eu-west-2: false}`). Enabled by default.
+    """
+    auto_enable = model.custom.get("auto_enable", True)
+    if isinstance(auto_enable, dict):
+        return auto_enable.get(region, True)
+    return auto_enable
+
+
+def get_aws_settings(model: Prodict) -> Dict[str, Any]:
+    """The arguments of `AwsClient.configure()`."""
+    return dict(max_pool_connections=model.system.aws_max_pool_connections,
+                retry_mode=model.system.aws_retry_mode,
+                max_attempts=model.system.aws_max_attempts)
+
+
+def get_ssh_tunnel(model: Prodict) -> SshTunnel:
+    """An SSH tunnel through the bastion host, authenticated just like the external one (see `run-proxy.sh`)."""
+    bh = model.bastion_host
+    pkey = None
+    key_filename = None
+    if bh.admin_private_key:
+        pkey = load_private_key(bh.admin_private_key, bh.admin_key_passphrase)
+    else:
+        key_filename = bh.admin_key_filename or f"{model.system.config_dir}/admin_id_rsa"
+    return SshTunnel(bh.hostname, bh.proxy_username, port=bh.port, pkey=pkey, key_filename=key_filename,
+                     passphrase=bh.admin_key_passphrase)
+
+
 class CustomGatherer(Gatherer):
+    reads = ("system.config_dir",)
+    writes = ("custom",)
+
     def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
         """Loads the optional `custom.yaml` from the configuration directory."""
         issues = []
@@ -1,88 +1,150 @@
-import socket
+import asyncio
 from concurrent.futures.thread import ThreadPoolExecutor
-from typing import Tuple, List, Optional
-from urllib.parse import urlparse
+from functools import partial
+from typing import Any, Callable, Dict, Tuple, List, Optional
 
-import mysql.connector
-# noinspection PyPackageRequirements
-import socks
 from loguru import logger
+from mysql.connector import MySQLConnection
 from prodict import Prodict
 
-from main.domain import DbStatus, Issue, IssueLevel
+from main.domain import DbStatus, GrantMode, Issue, IssueLevel
+from main.secret_ref import prefetch_secrets, resolve_secret
+from main.util import SocketFactory, mysql_connect, socks_socket_factory
 from .gatherer import Gatherer
 
 MYSQL_CONNECT_TIMEOUT = 4
 MYSQL_LOGIN_TIMEOUT = 10
+MYSQL_MAX_CONCURRENT_PROBES = 32
+
+# The roles granted to the users (see `GrantMode.ROLE`) are only active if they're all activated at login.
+ROLES_ON_LOGIN_QUERY = "SELECT @@GLOBAL.activate_all_roles_on_login"
+
+# (success, result or error message)
+ProbeResult = Tuple[bool, Any]
 
 
 class MySqlGatherer(Gatherer):
+    reads = ("aws.databases", "custom")
+    writes = ("aws.databases",)
 
-    def __init__(self, executor: ThreadPoolExecutor, proxy: Optional[str]):
-        self.executor = executor
-        self.proxy = proxy
+    def __init__(self, proxy: Optional[str], max_concurrency: int = MYSQL_MAX_CONCURRENT_PROBES,
+                 deadline: float = MYSQL_LOGIN_TIMEOUT, socket_factory: Optional[SocketFactory] = None):
+        """
+        :param proxy: The URL of the SOCKS proxy the connections go through, if any.
+        :param max_concurrency: Maximum number of instances probed at the same time.
+        :param deadline: Maximum duration (in seconds) of each probe.
+        :param socket_factory: Creates the connections to the instances, e.g. through an SSH tunnel.
+         Takes precedence over the proxy.
+        """
+        self.socket_factory = socket_factory or (socks_socket_factory(proxy) if proxy else None)
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
 
     def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
-        with _ProxyContext(self.proxy):
-            return self._gather_rds_status(model)
+        return self._gather_rds_status(model)
 
     def _gather_rds_status(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
         """
         For all RDS instances: check if it's possible to connect, authenticate with credentials, and get authorized
-         access to the primary DB. Reports each instance check on the console.
+         access to the primary DB. Reports each instance check on the console, as soon as it completes.
+        In role mode, also checks the roles are activated at login.
         """
 
         databases = model.aws.databases
         logger.info("Checking access to RDS instances:")
 
         issues = []
-        futures = []
-        for db_uid, db in databases.items():
-            if 'endpoint' in db:
-                future = self.executor.submit(_check_mysql_instance, db)
-            else:
-                future = None
-            futures.append(future)
-        db_id_max_len = max(map(len, databases))
+        db_id_max_len = max(map(len, databases), default=0)
         updates = {}
         accessible = dict(status=DbStatus.ACCESSIBLE.name)
-        for db_uid, future in zip(databases, futures):
-            if future:
-                success, message = future.result(MYSQL_LOGIN_TIMEOUT)
-                color = ("red", "green")[success]
-                if success:
-                    updates[db_uid] = accessible
-                else:
-                    issues.append(Issue(level=IssueLevel.ERROR, type="DB", id=db_uid,
-                                        message=message))
+
+        def report(db_uid: str, result: ProbeResult):
+            success, message, *warnings = result
+            color = ("red", "green")[success]
+            if success:
+                updates[db_uid] = accessible
             else:
-                success, message = (False, databases[db_uid].status)
-                color = "light-magenta"
+                issues.append(Issue(level=IssueLevel.ERROR, type="DB", id=db_uid,
+                                    message=message))
+            for warning in warnings:
+                issues.append(Issue(level=IssueLevel.WARNING, type="DB", id=db_uid, message=warning))
+            log(db_uid, color, message)
+
+        def log(db_uid: str, color: str, message: str):
             leader = "." * (2 + db_id_max_len - len(db_uid))
             logger.opt(colors=True).info(f"  {db_uid} {leader} <{color}>{message}</{color}>")
+
+        reachable = {}
+        for db_uid, db in databases.items():
+            if 'endpoint' in db:
+                reachable[db_uid] = db
+            else:
+                log(db_uid, "light-magenta", db.status)
+        # Only the master passwords of the reachable instances are ever needed.
+        prefetch_secrets(db.get("master_password") for db in reachable.values())
+        role_mode = GrantMode((model.get("custom") or {}).get("grant_mode", GrantMode.USER.value)) == GrantMode.ROLE
+        probe = partial(_check_mysql_instance, socket_factory=self.socket_factory, timeout=self.deadline,
+                        check_roles=role_mode)
+        asyncio.run(probe_all(reachable, probe, report, self.max_concurrency, self.deadline))
         return Prodict(aws={"databases": updates}), issues
 
 
-def _check_mysql_instance(db) -> Tuple[bool, str]:
+async def probe_all(databases: Dict[str, Prodict],
+                    probe: Callable[[Prodict], ProbeResult],
+                    report: Callable[[str, ProbeResult], None],
+                    max_concurrency: int,
+                    deadline: float):
+    """
+    Probe all databases concurrently, reporting each result as soon as it's available.
+
+    :param probe: The (blocking) probe of a single database, run on a thread of its own. It should give up by itself
+     once the deadline is over (e.g. using socket timeouts): its thread is only released by then.
+    :param report: Called with the UID of the database and the result of its probe, in order of completion.
+    :param max_concurrency: Maximum number of probes running at the same time, late ones included.
+    :param deadline: Maximum duration (in seconds) of each probe, counted from the moment it starts running.
+     A late probe is reported as failed.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def probe_one(db_uid: str, db: Prodict) -> Tuple[str, ProbeResult]:
+        started = asyncio.Event()
+
+        def run() -> ProbeResult:
+            loop.call_soon_threadsafe(started.set)
+            return probe(db)
+
+        future = loop.run_in_executor(executor, run)
+        await started.wait()
+        try:
+            return db_uid, await asyncio.wait_for(future, deadline)
+        except asyncio.TimeoutError:
+            return db_uid, (False, f"ERROR: No answer after {deadline} seconds")
+        except Exception as e:  # pylint: disable=broad-except
+            return db_uid, (False, f"ERROR: {str(e)}")
+
+    # A late probe keeps its thread busy, so the concurrency is bounded by the executor itself.
+    with ThreadPoolExecutor(max_concurrency, thread_name_prefix="mysql-probe") as executor:
+        # Scheduled right away, so the probes start in the order of the databases.
+        tasks = [asyncio.ensure_future(probe_one(db_uid, db)) for db_uid, db in databases.items()]
+        for completed in asyncio.as_completed(tasks):
+            report(*await completed)
+
+
+def _check_mysql_instance(db, socket_factory: Optional[SocketFactory] = None,
+                          timeout: float = MYSQL_LOGIN_TIMEOUT, check_roles: bool = False) -> ProbeResult:
     """For a particular RDS instances: check if it's possible to connect, authenticate with credentials,
     and get authorized access to the primary DB.
 
-    :returns: if the check succeeded, returns **True** and the server version string.
-    Otherwise, returns **False** and the corresponding error message.
+    :param check_roles: Also check the roles granted to the users are activated at login.
+    :returns: if the check succeeded, returns **True** and the server version string, followed by the warnings about
+    the instance, if any. Otherwise, returns **False** and the corresponding error message.
     """
     connection = None
     try:
-        connection = mysql.connector.connect(host=db.endpoint.address,
-                                             port=db.endpoint.port,
-                                             ssl_disabled=True,
-                                             database="mysql",
-                                             user=db.master_username,
-                                             password=db.master_password,
-                                             connection_timeout=MYSQL_CONNECT_TIMEOUT,
-                                             # Only Pure Python connector implementation supports SOCKS5
-                                             use_pure=True)
+        connection = connect_instance(db, socket_factory, timeout)
         db_info = connection.get_server_info()
-        return True, f'OK ("MySQL Server version {db_info}")'
+        warnings = _check_roles_on_login(connection) if check_roles else []
+        return (True, f'OK ("MySQL Server version {db_info}")', *warnings)
     except Exception as e:
         return False, f'ERROR: {str(e)}'
     finally:
@@ -91,19 +153,37 @@ def _check_mysql_instance(db) -> Tuple[bool, str]:
             connection.close()
 
 
-class _ProxyContext:
-    def __init__(self, proxy: Optional[str]):
-        self.proxy = proxy
-        self.old_socket = None
+def _check_roles_on_login(connection: MySQLConnection) -> List[str]:
+    """
+    The users are granted their roles without any default one (unsupported by the MySQL provider), so the roles are
+    only active if the instance activates all of them at login.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(ROLES_ON_LOGIN_QUERY)
+        (enabled,), = cursor.fetchall()
+    except Exception as e:  # pylint: disable=broad-except
+        return [f"Unable to check the roles are activated at login: {str(e)}"]
+    finally:
+        cursor.close()
+    if not int(enabled):
+        return ["The roles are not activated at login: enable activate_all_roles_on_login (in the parameter group)"]
+    return []
 
-    def __enter__(self):
-        self.old_socket = socket.socket
-        if self.proxy:
-            # Monkeypatch
-            parts = urlparse(self.proxy)
-            proxy_type = socks.PROXY_TYPES[parts.scheme.upper()]
-            socks.set_default_proxy(proxy_type, parts.hostname, parts.port)
-            socket.socket = socks.socksocket
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        socket.socket = self.old_socket
+def connect_instance(db, socket_factory: Optional[SocketFactory] = None,
+                     timeout: float = MYSQL_LOGIN_TIMEOUT) -> MySQLConnection:
+    """
+    Connects to the primary DB of an RDS instance with its master credentials (resolved if needed).
+
+    :param timeout: Maximum duration (in seconds) of each operation on the connection.
+    """
+    return mysql_connect(socket_factory,
+                         read_timeout=timeout,
+                         host=db.endpoint.address,
+                         port=db.endpoint.port,
+                         ssl_disabled=True,
+                         database="mysql",
+                         user=db.master_username,
+                         password=resolve_secret(db.master_password),
+                         connection_timeout=MYSQL_CONNECT_TIMEOUT)
@@ -1,19 +1,35 @@
 import json
 import urllib.parse
 from concurrent.futures.thread import ThreadPoolExecutor
-from typing import List, Tuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 import jmespath
+import pytz
 from loguru import logger
 from prodict import Prodict
+from requests_futures.sessions import FuturesSession
 
-from main.domain import Issue, IssueLevel
-from main.util import async_retryable_session
+from main.domain import Issue, IssueLevel, Permission
+from main.util import FileCache, async_retryable_session
+from .config import MAX_DB_USERNAME_LENGTH
 from .gatherer import Gatherer
 
+# Limited by Okta. See https://developer.okta.com/docs/reference/api/users/#list-users
+OKTA_MAX_PAGE_SIZE = 200
 
-class OktaGatherer(Gatherer):
+# Tolerates some clock skew between this host and Okta.
+OKTA_SYNC_MARGIN = timedelta(minutes=1)
+# The incremental sync misses the users deleted from Okta (and any update lost in between): all the users are looked
+# up again once in a while.
+OKTA_FULL_SYNC_INTERVAL = timedelta(days=1)
+OKTA_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
 
+# (user_id, status, ssh_pubkey)
+OktaUser = Tuple[str, str, Optional[str]]
+
+
+class _OktaGatherer(Gatherer):
     def __init__(self, api_token, executor: ThreadPoolExecutor):
         """
         :param executor: An asynchronous executor
@@ -21,60 +37,219 @@ class OktaGatherer(Gatherer):
         self.api_token = api_token
         self.executor = executor
 
+    def _get_all_pages(self, session: FuturesSession, result) -> List[dict]:
+        """Get the items of the given page and of all the next ones."""
+        items = self._get_json(result)
+        while "next" in result.links:
+            result = session.get(result.links["next"]["url"], headers=(self._http_headers())).result()
+            items.extend(self._get_json(result))
+        return items
+
+    @staticmethod
+    def _get_json(result):
+        result.raise_for_status()
+        return json.loads(result.content.decode())
+
+    def _http_headers(self):
+        return {
+            'Accept': 'application/json',
+            'Authorization': f'SSWS {self.api_token}'
+        }
+
+
+class OktaGatherer(_OktaGatherer):
+    reads = ("okta",)
+    writes = ("okta.users",)
+
+    def __init__(self, api_token, executor: ThreadPoolExecutor, bulk_size: int = 0, cache_dir: str = None,
+                 full_sync_interval: timedelta = OKTA_FULL_SYNC_INTERVAL):
+        """
+        :param executor: An asynchronous executor
+        :param bulk_size: Maximum number of logins searched by a single request. If zero, each login is searched
+         on its own.
+        :param cache_dir: Directory where the Okta users are kept across runs. Once set, each run only retrieves
+         the users updated since the previous one.
+        :param full_sync_interval: Maximum age of the cached users, after which all of them are looked up again.
+        """
+        super().__init__(api_token, executor)
+        self.bulk_size = min(bulk_size, OKTA_MAX_PAGE_SIZE)
+        self.cache = FileCache(cache_dir, "okta")
+        self.full_sync_interval = full_sync_interval
+
     def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
         """
         Check if the users exist and retrieve their corresponding user_id and ssh_pubkey.
         """
         okta = model.okta
         session = async_retryable_session(self.executor)
+        users_url = f"https://{okta.organization}.okta.com/api/v1/users"
+        # The members of Okta groups were already checked.
+        logins = [login for login, user in okta.users.items() if "status" not in user]
+        okta_users = self._sync_users(session, okta.organization, users_url, logins)
+        logger.info(f"Checking Okta {okta.organization.capitalize()}'s Users:")
+        users_ext, issues = _check_users(logins, okta_users)
+        return Prodict(okta={"users": users_ext}), issues
+
+    def _sync_users(self, session: FuturesSession, organization: str, users_url: str,
+                    logins: List[str]) -> Dict[str, OktaUser]:
+        """
+        Refresh the users kept from the previous run with the ones updated since then, and look up the others.
+        All the users are looked up once the last full sync is older than `full_sync_interval`.
+        """
+        cache_key = f"{organization}/users"
+        cached = self.cache.get(cache_key) or {}
+        sync_time = datetime.now(pytz.utc) - OKTA_SYNC_MARGIN
+        last_full_sync = _parse_time(cached["last_full_sync"]) if "last_full_sync" in cached else None
+        okta_users = {}
+        if last_full_sync and sync_time - last_full_sync < self.full_sync_interval:
+            okta_users = {login: tuple(user) for login, user in cached["users"].items()}
+            expression = f'lastUpdated gt "{cached["last_sync"]}"'
+            future = session.get(f"{users_url}?limit={OKTA_MAX_PAGE_SIZE}&search=" + urllib.parse.quote(expression),
+                                 headers=(self._http_headers()))
+            for user in self._get_all_pages(session, future.result()):
+                okta_users[user["profile"]["login"].lower()] = _to_okta_user(user)
+        else:
+            last_full_sync = sync_time
+        # The users no longer configured are not kept, so they are looked up again if they ever come back.
+        wanted_logins = {login.lower() for login in logins}
+        okta_users = {login: user for login, user in okta_users.items() if login in wanted_logins}
+        missing_logins = [login for login in logins if login.lower() not in okta_users]
+        if self.bulk_size:
+            okta_users.update(self._bulk_search_users(session, users_url, missing_logins))
+        else:
+            okta_users.update(self._search_users(session, users_url, missing_logins))
+        self.cache.put(cache_key, {
+            "last_sync": sync_time.strftime(OKTA_TIME_FORMAT),
+            "last_full_sync": last_full_sync.strftime(OKTA_TIME_FORMAT),
+            "users": okta_users,
+        })
+        return okta_users
+
+    def _search_users(self, session: FuturesSession, users_url: str, logins: List[str]) -> Dict[str, OktaUser]:
+        """Search each login with its own request."""
         futures = []
         searcher = jmespath.compile("[*].[id, status, profile.sshPubKey] | [0]")
-        for login in okta.users:
-            future = session.get(f"https://{okta.organization}.okta.com/api/v1/users?limit=1&search=profile.login+eq+" +
-                                 urllib.parse.quote(f'"{login}"'),
+        for login in logins:
+            future = session.get(f"{users_url}?limit=1&search=profile.login+eq+" + urllib.parse.quote(f'"{login}"'),
+                                 headers=(self._http_headers()))
+            futures.append(future)
+        okta_users = {}
+        for login, future in zip(logins, futures):
+            match = searcher.search(self._get_json(future.result()))
+            if match:
+                okta_users[login.lower()] = tuple(match)
+        return okta_users
+
+    def _bulk_search_users(self, session: FuturesSession, users_url: str,
+                           logins: List[str]) -> Dict[str, OktaUser]:
+        """Search up to `bulk_size` logins with each request by OR-combining their search expressions."""
+        futures = []
+        for index in range(0, len(logins), self.bulk_size):
+            expression = " or ".join(f'profile.login eq "{login}"' for login in logins[index:index + self.bulk_size])
+            future = session.get(f"{users_url}?limit={OKTA_MAX_PAGE_SIZE}&search=" + urllib.parse.quote(expression),
                                  headers=(self._http_headers()))
             futures.append(future)
+        okta_users = {}
+        for future in futures:
+            for user in self._get_all_pages(session, future.result()):
+                okta_users[user["profile"]["login"].lower()] = _to_okta_user(user)
+        return okta_users
+
 
+class OktaGroupGatherer(_OktaGatherer):
+    reads = ("okta",)
+    writes = ("okta.users", "aws.databases")
+
+    def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
+        """
+        Expand the Okta groups into their members, which get the permissions of the group(s) they belong to.
+        Users explicitly configured keep their own permissions.
+        """
+        okta = model.okta
+        groups = okta.get("groups") or {}
+        session = async_retryable_session(self.executor)
+        api_url = f"https://{okta.organization}.okta.com/api/v1"
+        futures = {group_name: session.get(f"{api_url}/groups?q=" + urllib.parse.quote(group_name),
+                                           headers=(self._http_headers()))
+                   for group_name in groups}
         issues = []
-        users_ext = {}
-        logger.info(f"Checking Okta {okta.organization.capitalize()}'s Users:")
-        login_max_len = max(map(len, okta.users), default=0)
-        for login, future in zip(okta.users, futures):
-            result = future.result()
-            result.raise_for_status()
-            json_response = json.loads(result.content.decode())
-            match = searcher.search(json_response)
-            user_data = {}
-            if match:
-                user_id, status, ssh_pubkey = match
-                if status != "ACTIVE":
-                    err_msg = f"status={status}"
-                elif ssh_pubkey:
-                    err_msg = None
-                    user_data = {
-                        "user_id": user_id,
-                        "ssh_pubkey": ssh_pubkey,
-                    }
-                else:
-                    status = "MISSING_SSH_PUBKEY"
-                    err_msg = "Missing SSH PubKey"
-            else:
-                status = "ABSENT"
-                err_msg = "Not found in OKTA"
-            user_data["status"] = status
-            if err_msg:
-                color = "red"
-                issues.append(Issue(level=IssueLevel.ERROR, type="USER", id=login, message=err_msg))
+        configured_logins = {login.lower() for login in okta.users}
+        members: Dict[str, OktaUser] = {}
+        member_permissions: Dict[str, Dict[str, Permission]] = {}
+        for group_name, future in futures.items():
+            group_id = next((group["id"] for group in self._get_json(future.result())
+                             if group["profile"]["name"] == group_name), None)
+            if not group_id:
+                issues.append(Issue(level=IssueLevel.ERROR, type="GROUP", id=group_name, message="Not found in OKTA"))
+                continue
+            result = session.get(f"{api_url}/groups/{group_id}/users?limit={OKTA_MAX_PAGE_SIZE}",
+                                 headers=(self._http_headers())).result()
+            for user in self._get_all_pages(session, result):
+                login = user["profile"]["login"]
+                if login.lower() in configured_logins:
+                    continue
+                members[login.lower()] = _to_okta_user(user)
+                permissions = member_permissions.setdefault(login, {})
+                # The first group granting access to a database wins.
+                for db_uid, permission in groups[group_name].permissions.items():
+                    permissions.setdefault(db_uid, permission)
+
+        if groups:
+            logger.info(f"Checking Okta {okta.organization.capitalize()}'s Group Members:")
+        users, member_issues = _check_users(list(member_permissions), members)
+        issues.extend(member_issues)
+        databases = {}
+        for login, permissions in member_permissions.items():
+            users[login].update(db_username=login[:MAX_DB_USERNAME_LENGTH], permissions=permissions)
+            for db_uid, permission in permissions.items():
+                databases.setdefault(db_uid, {"permissions": {}})["permissions"][login] = permission
+        return Prodict(okta={"users": users}, aws={"databases": databases}), issues
+
+
+def _check_users(logins: List[str], okta_users: Dict[str, OktaUser]) -> Tuple[Dict[str, dict], List[Issue]]:
+    """
+    Check the status of the users, reporting each one on the console.
+
+    :param okta_users: The Okta users found, by (lower case) login.
+    :return: The Okta attributes of the users, and the issues found.
+    """
+    issues = []
+    users_ext = {}
+    login_max_len = max(map(len, logins), default=0)
+    for login in logins:
+        match = okta_users.get(login.lower())
+        user_data = {}
+        if match:
+            user_id, status, ssh_pubkey = match
+            if status != "ACTIVE":
+                err_msg = f"status={status}"
+            elif ssh_pubkey:
+                err_msg = None
+                user_data = {
+                    "user_id": user_id,
+                    "ssh_pubkey": ssh_pubkey,
+                }
             else:
-                color = "green"
-            leader = "." * (2 + login_max_len - len(login))
-            logger.opt(colors=True).info(f"  {login} {leader} <{color}>{status}</{color}>")
-            users_ext[login] = user_data
+                status = "MISSING_SSH_PUBKEY"
+                err_msg = "Missing SSH PubKey"
+        else:
+            status = "ABSENT"
+            err_msg = "Not found in OKTA"
+        user_data["status"] = status
+        if err_msg:
+            color = "red"
+            issues.append(Issue(level=IssueLevel.ERROR, type="USER", id=login, message=err_msg))
+        else:
+            color = "green"
+        leader = "." * (2 + login_max_len - len(login))
+        logger.opt(colors=True).info(f"  {login} {leader} <{color}>{status}</{color}>")
+        users_ext[login] = user_data
+    return users_ext, issues
 
-        return Prodict(okta={"users": users_ext}), issues
 
-    def _http_headers(self):
-        return {
-            'Accept': 'application/json',
-            'Authorization': f'SSWS {self.api_token}'
-        }
+def _to_okta_user(user: dict) -> OktaUser:
+    return user["id"], user["status"], user["profile"].get("sshPubKey")
+
+
+def _parse_time(value: str) -> datetime:
+    return pytz.utc.localize(datetime.strptime(value, OKTA_TIME_FORMAT))
@@ -1,23 +1,58 @@
 import re
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 import pytz
 
 from main.aws_client import AwsClient
+from main.secret_ref import SSM_SCHEME, fetch_secret, make_secret_ref
 
 
 class MasterPasswordResolver:
-    def __init__(self, aws: AwsClient, regex_patterns: Dict[str, str], time_ref: datetime = None):
+    def __init__(self, aws: AwsClient, regex_patterns: Dict[str, str], time_ref: datetime = None,
+                 lazy: bool = False):
+        """
+        :param lazy: Leave the references to the master passwords unresolved (see `make_secret_ref()`), so the
+         passwords are only fetched when and where they are used. Their age is then unknown.
+        """
         if not time_ref:
             time_ref = datetime.now(pytz.utc)
         self.time_ref = time_ref
         self.aws = aws
         self.regex_patterns = regex_patterns
+        self.lazy = lazy
+        self._ssm_parameters: Dict[str, Optional[Tuple[str, datetime]]] = {}
 
-    def resolve(self, db_id, master_password: Optional[str]) -> Tuple[str, Optional[int]]:
+    def prefetch(self, db_refs: Iterable[Tuple[str, Optional[str]]]):
+        """
+        Fetch in batches all the SSM parameters referenced by the databases that will be resolved later.
+
+        :param db_refs: The pairs of DB instance ID and its (optional) master password.
+        """
+        if self.lazy:
+            return
+        names = set()
+        for db_id, master_password in db_refs:
+            try:
+                master_password = master_password or self._infer_master_password(db_id)
+            except ValueError:
+                # To be reported by resolve()
+                continue
+            if master_password.startswith(SSM_SCHEME):
+                names.add(master_password[len(SSM_SCHEME):])
+        names.difference_update(self._ssm_parameters)
+        if names:
+            try:
+                self._ssm_parameters.update(self.aws.ssm_get_encrypted_parameters(sorted(names)))
+            except Exception:  # pylint: disable=broad-except
+                # Falls back to fetching them one by one, so each failure is reported against its own database.
+                pass
+
+    def resolve(self, db_id, master_password: Optional[str]) -> Tuple[Any, Optional[int]]:
         if not master_password:
             master_password = self._infer_master_password(db_id)
+        if self.lazy:
+            return make_secret_ref(self.aws.region, master_password), None
         return self._expand_password(master_password)
 
     def _infer_master_password(self, db_id: str):
@@ -28,19 +63,18 @@ class MasterPasswordResolver:
         raise ValueError("Undefined master_password")
 
     def _expand_password(self, master_password) -> Tuple[str, Optional[int]]:
-        pwd_last_modified = None
-        if master_password.startswith('ssm:'):
-            master_password, pwd_last_modified = self.aws.ssm_get_encrypted_parameter(master_password[4:])
-        elif master_password.startswith('s3-prop:'):
-            s3_path = master_password[8:]
-            match = re.match(r"(?P<bucket_name>[^\s/]+)/(?P<key>\S+)\[(?P<property_name>\S+)\]", s3_path)
-            if not match:
-                raise ValueError(f"Invalid s3-prop reference: {s3_path}")
-            master_password, pwd_last_modified = self.aws.s3_get_property(match.group("bucket_name"),
-                                                                          match.group("key"),
-                                                                          match.group("property_name"))
+        master_password, pwd_last_modified = fetch_secret(self.aws, master_password, self._get_ssm_parameter)
         if isinstance(pwd_last_modified, datetime):
-            password_age = timedelta(seconds=(self.time_ref.timestamp() - pwd_last_modified.timestamp())).days
+            # Never negative, even if the clock of AWS is ahead.
+            password_age = timedelta(seconds=max(0.0, self.time_ref.timestamp() - pwd_last_modified.timestamp())).days
         else:
             password_age = False
         return master_password, password_age
+
+    def _get_ssm_parameter(self, name: str) -> Tuple[str, datetime]:
+        if name not in self._ssm_parameters:
+            return self.aws.ssm_get_encrypted_parameter(name)
+        parameter = self._ssm_parameters[name]
+        if not parameter:
+            raise ValueError(f"SSM parameter not found: {name}")
+        return parameter
@@ -0,0 +1,72 @@
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Set, Tuple
+
+from prodict import Prodict
+
+from main.aws_client import AwsClient
+from main.domain import Issue
+from main.util import dict_deep_merge
+from .config import DatabaseConfigGatherer
+from .dbinfo import DatabaseInfoGatherer
+from .gatherer import Gatherer
+from .pwd_resolver import MasterPasswordResolver
+
+
+class RegionGatherer(Gatherer):
+    reads = ()
+
+    def __init__(self, region: str, cfg_filename: str, master_password_defaults: Dict[str, str],
+                 aws_settings: Dict[str, Any], executor: Executor, lazy_secrets: bool = False,
+                 auto_enable: bool = True):
+        """
+        Gathers all the databases of a region as a single shard, by running the same gatherers as the in-process mode.
+
+        :param aws_settings: The arguments of `AwsClient.configure()` to be applied on the shard.
+        :param executor: A (usually process-based) executor. Every argument of the shard must be picklable.
+        :param lazy_secrets: Leave the master passwords unresolved (see `MasterPasswordResolver`).
+        :param auto_enable: Enable the instances not configured (see `DatabaseInfoGatherer`).
+        """
+        self.region = region
+        self.cfg_filename = cfg_filename
+        self.master_password_defaults = master_password_defaults
+        self.aws_settings = aws_settings
+        self.executor = executor
+        self.lazy_secrets = lazy_secrets
+        self.auto_enable = auto_enable
+        self.writes = (f"aws.databases.{region}",)
+
+    def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
+        future = self.executor.submit(gather_region, self.region, self.cfg_filename, self.master_password_defaults,
+                                      self.aws_settings, self.lazy_secrets, self.auto_enable)
+        updates, issues, rds_known_endpoints = future.result()
+        # Required to purge the Pulumi Stack, but collected on a different process.
+        AwsClient.get_rds_known_endpoints().update(rds_known_endpoints)
+        return updates, issues
+
+
+def get_region_gatherers(region: str, cfg_filename: str, aws_client: AwsClient,
+                         pwd_resolver: MasterPasswordResolver, auto_enable: bool = True) -> List[Gatherer]:
+    return [
+        DatabaseConfigGatherer(region, cfg_filename, pwd_resolver),
+        DatabaseInfoGatherer(aws_client, pwd_resolver, auto_enable),
+    ]
+
+
+def gather_region(region: str, cfg_filename: str, master_password_defaults: Dict[str, str],
+                  aws_settings: Dict[str, Any], lazy_secrets: bool = False,
+                  auto_enable: bool = True) -> Tuple[Prodict, List[Issue], Set[str]]:
+    """
+    Run all the gatherers of a region sequentially.
+
+    :return: The partial model, the issues, and the RDS endpoints found.
+    """
+    AwsClient.configure(**aws_settings)
+    aws_client = AwsClient(region)
+    pwd_resolver = MasterPasswordResolver(aws_client, master_password_defaults, lazy=lazy_secrets)
+    shard = Prodict(aws={"databases": {}})
+    all_issues = []
+    for gatherer in get_region_gatherers(region, cfg_filename, aws_client, pwd_resolver, auto_enable):
+        updates, issues = gatherer.gather(shard)
+        all_issues.extend(issues)
+        dict_deep_merge(shard, updates)
+    return shard, all_issues, AwsClient.get_rds_known_endpoints()
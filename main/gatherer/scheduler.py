@@ -0,0 +1,42 @@
+from typing import List, Sequence, Tuple
+
+from .gatherer import Gatherer
+
+
+def schedule_gatherers(gatherers: Sequence[Gatherer]) -> List[List[Gatherer]]:
+    """
+    Split the gatherers into waves that can be run concurrently.
+
+    A gatherer depends on every preceding gatherer that writes a model key it reads, so it's placed in the wave
+    following the latest of them. All the other orderings (write-after-write, write-after-read) are preserved by
+    merging the updates of each wave in the original order.
+
+    :param gatherers: The gatherers, in the order they would be run sequentially.
+    :return: The waves, each one keeping the original relative order of its gatherers.
+    """
+    levels: List[int] = []
+    for index, gatherer in enumerate(gatherers):
+        level = 0
+        for prev_index in range(index):
+            if _any_overlap(gatherers[prev_index].writes, gatherer.reads):
+                level = max(level, levels[prev_index] + 1)
+        levels.append(level)
+    waves: List[List[Gatherer]] = [[] for _ in range(max(levels, default=-1) + 1)]
+    for gatherer, level in zip(gatherers, levels):
+        waves[level].append(gatherer)
+    return waves
+
+
+def keys_overlap(key_a: str, key_b: str) -> bool:
+    """Two model keys overlap if one of them is a (dotted) prefix of the other."""
+    path_a, path_b = _split(key_a), _split(key_b)
+    common = min(len(path_a), len(path_b))
+    return path_a[:common] == path_b[:common]
+
+
+def _any_overlap(keys_a: Sequence[str], keys_b: Sequence[str]) -> bool:
+    return any(keys_overlap(a, b) for a in keys_a for b in keys_b)
+
+
+def _split(key: str) -> Tuple[str, ...]:
+    return tuple(key.split(".")) if key else ()
@@ -0,0 +1,103 @@
+import re
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from main.aws_client import AwsClient
+
+SSM_SCHEME = "ssm:"
+S3_PROP_SCHEME = "s3-prop:"
+
+
+def make_secret_ref(region: str, value: str) -> Any:
+    """
+    A reference to a secret kept on AWS (`ssm:` or `s3-prop:`), to be resolved on demand by `resolve_secret()`.
+    Any other value is the secret itself, and returned as is.
+    """
+    if value.startswith((SSM_SCHEME, S3_PROP_SCHEME)):
+        return {"secret": value, "region": region}
+    return value
+
+
+def resolve_secret(value: Any) -> Any:
+    """Resolves a secret reference (see `make_secret_ref()`), only once per process."""
+    return _resolver.resolve(value)
+
+
+def prefetch_secrets(values: Iterable[Any]):
+    """Resolves in batches the secret references to be used soon."""
+    _resolver.prefetch(values)
+
+
+def fetch_secret(aws: AwsClient, reference: str,
+                 ssm_get_parameter: Callable[[str], Tuple[str, datetime]] = None) -> Tuple[str, Optional[datetime]]:
+    """
+    Gets the value of a secret and when it was last modified (if known).
+
+    :param reference: Either `ssm:<parameter name>`, `s3-prop:<bucket>/<key>[<property name>]`, or the value itself.
+    """
+    if reference.startswith(SSM_SCHEME):
+        return (ssm_get_parameter or aws.ssm_get_encrypted_parameter)(reference[len(SSM_SCHEME):])
+    if reference.startswith(S3_PROP_SCHEME):
+        s3_path = reference[len(S3_PROP_SCHEME):]
+        match = re.match(r"(?P<bucket_name>[^\s/]+)/(?P<key>\S+)\[(?P<property_name>\S+)\]", s3_path)
+        if not match:
+            raise ValueError(f"Invalid s3-prop reference: {s3_path}")
+        return aws.s3_get_property(match.group("bucket_name"), match.group("key"), match.group("property_name"))
+    return reference, None
+
+
+class SecretResolver:
+    def __init__(self):
+        """Resolves the secret references, each one once, even if requested concurrently."""
+        self._secrets: Dict[Tuple[str, str], Future] = {}
+        self._lock = Lock()
+
+    def resolve(self, value: Any) -> Any:
+        if not isinstance(value, dict):
+            return value
+        future, owned = self._get_future(value["region"], value["secret"])
+        if owned:
+            try:
+                future.set_result(fetch_secret(AwsClient(value["region"]), value["secret"])[0])
+            except Exception as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+        return future.result()
+
+    def prefetch(self, values: Iterable[Any]):
+        ssm_names: Dict[str, Dict[str, Future]] = defaultdict(dict)
+        for value in values:
+            if isinstance(value, dict) and value["secret"].startswith(SSM_SCHEME):
+                future, owned = self._get_future(value["region"], value["secret"])
+                if owned:
+                    ssm_names[value["region"]][value["secret"][len(SSM_SCHEME):]] = future
+        for region, futures in ssm_names.items():
+            aws = AwsClient(region)
+            try:
+                parameters = aws.ssm_get_encrypted_parameters(sorted(futures))
+            except Exception:  # pylint: disable=broad-except
+                # Falls back to fetching them one by one, so each failure is reported against its own database.
+                parameters = {}
+            for name, future in futures.items():
+                try:
+                    if name not in parameters:
+                        parameters[name] = aws.ssm_get_encrypted_parameter(name)
+                    if not parameters[name]:
+                        raise ValueError(f"SSM parameter not found: {name}")
+                    future.set_result(parameters[name][0])
+                except Exception as e:  # pylint: disable=broad-except
+                    future.set_exception(e)
+
+    def _get_future(self, region: str, reference: str) -> Tuple[Future, bool]:
+        """:return: The future of the secret, and whether the caller is in charge of resolving it."""
+        with self._lock:
+            future = self._secrets.get((region, reference))
+            if future:
+                return future, False
+            future = self._secrets[(region, reference)] = Future()
+            return future, True
+
+
+_resolver = SecretResolver()
@@ -1,3 +1,10 @@
+from .changes import (
+    ALL_SHARDS,
+    ModelChanges,
+)
 from .main import (
+    PHASES,
     Updater,
+    parse_shard,
+    sort_shards,
 )
@@ -0,0 +1,205 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+from prodict import Prodict
+
+from main.domain import Permission
+from main.util import FileCache
+
+# The parts of the model that make a difference to the updater, by name.
+MODEL_SECTIONS = {
+    "users": ("okta", "users"),
+    "databases": ("aws", "databases"),
+    "applications": ("applications",),
+    "glue_connections": ("aws", "glue_connections"),
+    "job": ("job",),
+    "custom": ("custom",),
+}
+
+# Never stored, not even hashed: their changes are unknown (and affect nothing, see `get_affected_shards()`).
+SECRET_KEYS = frozenset(("master_password", "api_token", "admin_private_key", "admin_key_passphrase"))
+
+# Observations that change from run to run, left out.
+OBSERVED_KEYS = frozenset(("password_age", "live_grants", "grant_drift", "orphaned_users"))
+
+ALL_SHARDS = "*"
+
+# section -> kind of change ("added", "removed" or "changed") -> keys
+ModelDiff = Dict[str, Dict[str, List[str]]]
+
+
+class ModelChanges:
+    def __init__(self, cache_dir: Optional[str], key: str):
+        """
+        Tells what changed in the model since the last successful update of each shard, in order to skip the
+        unaffected ones (see `Updater.update_shard()`). Without a cache directory, everything is always assumed as
+        changed.
+
+        :param key: Identifies the updated (base) Pulumi stack.
+        """
+        self.cache = FileCache(cache_dir, "model")
+        self.key = key
+
+    def select_shards(self, model: Prodict, shards: Iterable[str] = ()) -> List[str]:
+        """
+        Compares the model with the one of the last successful update of each shard (i.e. of its stack), which
+        it's pending to replace until `commit()` is called. A shard never updated so far is always affected.
+
+        :param shards: The shards updated separately, if any.
+        :return: The given shards affected by the changes, or `[ALL_SHARDS]` if the model is not sharded and has
+         changed.
+        """
+        current = take_snapshot(model)
+        self.cache.put(f"{self.key}/pending", current)
+        # The grants that drifted must be restored, even if nothing changed.
+        drifted = {f"mysql:{_region(db_uid)}" for db_uid, db in model.aws.databases.items() if db.get("grant_drift")}
+        # The shards usually share their last update: each distinct one is only compared (and logged) once.
+        affected_since: Dict[str, Set[str]] = {}
+        selected = []
+        for shard in (list(shards) or [ALL_SHARDS]):
+            previous = self.cache.get(self._snapshot_key(shard))
+            affected = None
+            if previous:
+                affected = affected_since.get(previous["digest"])
+                if affected is None:
+                    diff = diff_snapshots(previous, current)
+                    log_model_diff(diff)
+                    affected = affected_since[previous["digest"]] = \
+                        get_affected_shards(diff, previous["sections"], current["sections"]) | drifted
+            selected.extend(select_shards([shard], affected))
+        return selected
+
+    def commit(self, shards: Iterable[str] = (ALL_SHARDS,)):
+        """
+        Records the model of the current update as successfully applied.
+
+        :param shards: The shards successfully updated, if sharded.
+        """
+        pending = self.cache.get(f"{self.key}/pending")
+        if pending:
+            for shard in shards:
+                self.cache.put(self._snapshot_key(shard), pending)
+
+    def _snapshot_key(self, shard: str) -> str:
+        # Same as the name of the stack of the shard (see `shard_stack_name()`).
+        return self.key if shard == ALL_SHARDS else f"{self.key}.{shard.replace(':', '.')}"
+
+
+def take_snapshot(model: Prodict) -> Dict[str, Any]:
+    """The canonical form of the sections of the model, without its secrets, and its digest."""
+    sections = {}
+    for name, path in MODEL_SECTIONS.items():
+        section = model
+        for key in path:
+            section = (section or {}).get(key)
+        sections[name] = _redact(json.loads(json.dumps(section or {}, sort_keys=True, default=_to_json)))
+    canonical = json.dumps(sections, sort_keys=True, separators=(",", ":"))
+    return dict(digest=hashlib.sha256(canonical.encode()).hexdigest(), sections=sections)
+
+
+def diff_snapshots(previous: Dict[str, Any], current: Dict[str, Any]) -> ModelDiff:
+    """The entries (e.g. the users) added, removed or changed, by section. Only sections with changes are
+    included."""
+    diff = {}
+    if previous["digest"] == current["digest"]:
+        return diff
+    for name in MODEL_SECTIONS:
+        old = previous["sections"].get(name) or {}
+        new = current["sections"].get(name) or {}
+        if old == new:
+            continue
+        if not (isinstance(old, dict) and isinstance(new, dict)):
+            diff[name] = {"changed": [name]}
+            continue
+        changes = {
+            "added": sorted(new.keys() - old.keys()),
+            "removed": sorted(old.keys() - new.keys()),
+            "changed": [key for key in sorted(old.keys() & new.keys()) if old[key] != new[key]],
+        }
+        diff[name] = {kind: keys for kind, keys in changes.items() if keys}
+    return diff
+
+
+def log_model_diff(diff: ModelDiff):
+    if not diff:
+        logger.info("Model unchanged since the last update")
+        return
+    logger.info("Model changes since the last update:")
+    for section, changes in diff.items():
+        summary = ", ".join(f"{kind.replace('_', ' ')}: {len(keys)}" for kind, keys in changes.items())
+        logger.info(f"  {section} ({summary})")
+
+
+def get_affected_shards(diff: ModelDiff, previous: Dict[str, Any], current: Dict[str, Any]) -> Set[str]:
+    """
+    The shards (`phase[:region]`) affected by the changes. Changing only a master password affects nothing:
+    it's just used to connect.
+    """
+    shards = set()
+
+    def entries(section: str) -> Iterable[Any]:
+        changes = diff.get(section, {})
+        for key in (*changes.get("added", []), *changes.get("removed", []), *changes.get("changed", [])):
+            for snapshot in (previous, current):
+                entry = snapshot[section].get(key) if isinstance(snapshot[section], dict) else None
+                if entry is not None:
+                    yield key, entry
+
+    for login, user in entries("users"):
+        shards.update(("iam", "bastion_host"))
+        shards.update(f"mysql:{_region(db_uid)}" for db_uid in (user.get("permissions") or {}))
+    for db_uid, _ in entries("databases"):
+        region = _region(db_uid)
+        shards.add(f"mysql:{region}")
+        old_db, new_db = (snapshot["databases"].get(db_uid) or {} for snapshot in (previous, current))
+        # The permissions only matter to the users.
+        if _without(old_db, "permissions") != _without(new_db, "permissions"):
+            shards.update((f"glue_connections:{region}", f"applications:{region}"))
+    for _, db_list in entries("applications"):
+        # The mysql shard declares the roles granted to the applications (in role mode).
+        shards.update(f"{phase}:{_region(db_uid)}" for db_uid in db_list for phase in ("mysql", "applications"))
+    for db_uid, _ in entries("glue_connections"):
+        shards.add(f"glue_connections:{_region(db_uid)}")
+    if "job" in diff:
+        shards.add("cloudwatch")
+    if "custom" in diff:
+        shards.add(ALL_SHARDS)
+    return shards
+
+
+def select_shards(shards: List[str], affected: Optional[Set[str]]) -> List[str]:
+    """
+    The shards affected by the changes. A shard without region (e.g. `mysql`) is affected by the changes of any
+    region, and `ALL_SHARDS` by any change.
+
+    :param affected: If unknown (`None`), all shards are affected.
+    """
+    if affected is None or ALL_SHARDS in affected:
+        return shards
+    affected_phases = {shard.partition(":")[0] for shard in affected}
+    return [shard for shard in shards
+            if (shard == ALL_SHARDS and affected)
+            or shard in affected
+            or (":" not in shard and shard in affected_phases)]
+
+
+def _redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items() if key not in SECRET_KEYS | OBSERVED_KEYS}
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def _to_json(value: Any) -> Any:
+    return value.to_dict() if isinstance(value, Permission) else str(value)
+
+
+def _without(entry: Dict[str, Any], key: str) -> Dict[str, Any]:
+    return {k: v for k, v in entry.items() if k != key}
+
+
+def _region(db_uid: str) -> str:
+    return db_uid.split("/")[0]
@@ -1,10 +1,11 @@
+import hashlib
 import json
 import os
 import tempfile
 from datetime import datetime
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from loguru import logger
 from paramiko import SSHException
@@ -18,7 +19,8 @@ import pulumi_aws.iam as iam
 import pulumi_aws.ssm as ssm
 import pulumi_mysql as mysql
 import pulumi_random as random
-from main.domain import DbStatus
+from main.domain import DbStatus, GrantMode
+from main.secret_ref import prefetch_secrets, resolve_secret
 
 from .ssh import update_authorized_keys
 
@@ -30,11 +32,31 @@ SARI_ROLE_NAME = "SARI"
 
 DEFAULT_GRANT_TYPE = 'query'
 
+# Limited by MySQL. See https://dev.mysql.com/doc/refman/8.0/en/user-names.html
+MAX_ROLE_NAME_LENGTH = 32
+
+
+# The updater phases, in order, mapped to whether they can be restricted to a single region.
+PHASES = {
+    "cloudwatch": False,
+    "iam": False,
+    "mysql": True,
+    "glue_connections": True,
+    "applications": True,
+    "bastion_host": False,
+}
+
 
 class Updater:
 
-    def __init__(self, model: Prodict):
+    def __init__(self, model: Prodict, region: Optional[str] = None):
+        """
+        :param region: If set, only the resources of the databases in this region are updated.
+        """
         self.model = model
+        self.region = region
+        # (db_uid, db_name, grant_type) -> the MySQL role declared by this program
+        self.mysql_roles: Dict[Tuple[str, str, str], mysql.Role] = {}
         self.standard_tags = {
             "Provisioning": "SARI",
             "sari:configuration": _get_sari_configuration_repo(),
@@ -42,12 +64,17 @@ class Updater:
         }
 
     def update_all(self):
-        self.update_cloudwatch()
-        self.update_iam()
-        self.update_mysql()
-        self.update_glue_connections()
-        self.update_applications()
-        self.update_bastion_host()
+        for phase in PHASES:
+            self.update_phase(phase)
+
+    def update_phase(self, phase: str):
+        getattr(self, f"update_{phase}")()
+
+    def update_shard(self, shard: str):
+        """Update the resources of a single shard (see `parse_shard()`), each one kept on its own Pulumi stack."""
+        phase, region = parse_shard(shard)
+        self.region = region
+        self.update_phase(phase)
 
     def update_cloudwatch(self):
         dt: datetime = self.model.job.next_transition
@@ -87,10 +114,15 @@ class Updater:
             iam.RolePolicyAttachment("sari", role=SARI_ROLE_NAME, policy_arn=policy.arn)
 
     def update_mysql(self):
+        databases = self.model.aws.databases
+        self._prefetch_master_passwords(db_uid for db_uid in self._mysql_databases()
+                                        if DbStatus[databases[db_uid].status] >= DbStatus.ACCESSIBLE)
         for login, user in self.model.okta.users.items():
             if user.status != "ACTIVE":
                 continue
             for db_uid, permission in user.permissions.items():
+                if not self._in_region(db_uid):
+                    continue
                 db = self.model.aws.databases[db_uid]
                 if DbStatus[db.status] < DbStatus.ACCESSIBLE:
                     continue
@@ -105,6 +137,18 @@ class Updater:
                                             provider=provider,
                                             delete_before_replace=True,
                                         ))
+                if self._in_role_mode():
+                    mysql.Grant(resource_name,
+                                user=mysql_user.user,
+                                database=db.db_name,
+                                host=ANY_HOST,
+                                roles=[self._get_mysql_role(db_uid, db_name, permission.grant_type)
+                                       for db_name in permission.db_names],
+                                opts=pulumi.ResourceOptions(
+                                    provider=provider,
+                                    delete_before_replace=True,
+                                ))
+                    continue
                 for db_name in permission.db_names:
                     grant_name = resource_name if db_name == db.db_name \
                                                   else self._res_name(f"{db_uid}.{db_name}/{login}")
@@ -117,11 +161,21 @@ class Updater:
                                     provider=provider,
                                     delete_before_replace=True,
                                 ))
+        if self._in_role_mode():
+            # The roles of the applications are declared here as well, so each one belongs to a single stack when the
+            # phases are sharded (see `update_applications()`).
+            for db_uid in sorted(set(db_uid for db_list in self.model.applications.values() for db_uid in db_list)):
+                db = self.model.aws.databases[db_uid]
+                if self._in_region(db_uid) and DbStatus[db.status] >= DbStatus.ACCESSIBLE:
+                    self._get_mysql_role(db_uid, db.db_name, DEFAULT_GRANT_TYPE)
 
     def update_glue_connections(self):
         glue_connections = self.model.aws.glue_connections
         databases = self.model.aws.databases
+        self._prefetch_master_passwords(glue_connections)
         for db_uid, con in glue_connections.items():
+            if not self._in_region(db_uid):
+                continue
             db = databases[db_uid]
             resource_name = self._res_name(f"glue/{db_uid}")
             password = random.RandomPassword(resource_name,
@@ -173,8 +227,11 @@ class Updater:
     def update_applications(self):
         applications: Dict[str, dict] = self.model.applications
         databases = self.model.aws.databases
+        self._prefetch_master_passwords(db_uid for db_list in applications.values() for db_uid in db_list)
         for app_name, db_list in applications.items():
             for db_uid in db_list:
+                if not self._in_region(db_uid):
+                    continue
                 db = databases[db_uid]
                 region, db_id = db_uid.split("/")
                 aws_provider = self._get_aws_provider(region)
@@ -204,11 +261,15 @@ class Updater:
                                             provider=mysql_provider,
                                             delete_before_replace=True,
                                         ))
+                if self._in_role_mode():
+                    grant_args = dict(roles=[self._ref_mysql_role(db_uid, db.db_name, DEFAULT_GRANT_TYPE)])
+                else:
+                    grant_args = dict(privileges=self.model.custom.grant_types[DEFAULT_GRANT_TYPE])
                 mysql.Grant(resource_basename,
                             user=mysql_user.user,
                             database=db.db_name,
                             host=mysql_user.host,
-                            privileges=self.model.custom.grant_types[DEFAULT_GRANT_TYPE],
+                            **grant_args,
                             opts=pulumi.ResourceOptions(
                                 provider=mysql_provider,
                                 delete_before_replace=True,
@@ -257,6 +318,60 @@ class Updater:
         name = region if region != self.model.aws.default_region else "default"
         return pulumi_aws.Provider(name, region=region)
 
+    def _in_region(self, db_uid: str) -> bool:
+        return not self.region or db_uid.split("/")[0] == self.region
+
+    def _in_role_mode(self) -> bool:
+        return GrantMode(self.model.custom.get("grant_mode", GrantMode.USER.value)) == GrantMode.ROLE
+
+    def _get_mysql_role(self, db_uid: str, db_name: str, grant_type: str) -> pulumi.Output:
+        """Returns the name of the role having the privileges of the grant type on the given database (of the
+        instance referenced by its UID). The role is declared on its first use, only by `update_mysql()`.
+
+        No default role can be set on the users, so the roles are only effective at login if the instance has
+        `activate_all_roles_on_login` enabled (reported otherwise by `MySqlGatherer`)."""
+        key = (db_uid, db_name, grant_type)
+        if key in self.mysql_roles:
+            return self.mysql_roles[key].name
+        provider = self._get_mysql_provider(db_uid)
+        resource_name = self._res_name(f"{db_uid}.{db_name}/role:{grant_type}")
+        role = self.mysql_roles[key] = mysql.Role(resource_name,
+                          name=_role_name(db_name, grant_type),
+                          opts=pulumi.ResourceOptions(
+                              provider=provider,
+                              delete_before_replace=True,
+                          ))
+        mysql.Grant(resource_name,
+                    role=role.name,
+                    database=db_name,
+                    privileges=self.model.custom.grant_types[grant_type],
+                    opts=pulumi.ResourceOptions(
+                        provider=provider,
+                        delete_before_replace=True,
+                    ))
+        return role.name
+
+    def _ref_mysql_role(self, db_uid: str, db_name: str, grant_type: str) -> pulumi.Input[str]:
+        """
+        References a role declared by `update_mysql()`: through its resource if in the same program (so it's created
+        first), otherwise by its name, as it belongs to the stack of the mysql shard.
+        """
+        role = self.mysql_roles.get((db_uid, db_name, grant_type))
+        return role.name if role else _role_name(db_name, grant_type)
+
+    def _mysql_databases(self) -> List[str]:
+        """The databases of the active users, and of the applications in role mode (see `update_mysql()`)."""
+        db_uids = {db_uid for user in self.model.okta.users.values() if user.status == "ACTIVE"
+                   for db_uid in user.permissions}
+        if self._in_role_mode():
+            db_uids.update(db_uid for db_list in self.model.applications.values() for db_uid in db_list)
+        return sorted(db_uids)
+
+    def _prefetch_master_passwords(self, db_uids: Iterable[str]):
+        """Resolves in batches the master passwords of the databases (of the region), used by their MySQL providers."""
+        databases = self.model.aws.databases
+        prefetch_secrets(databases[db_uid].get("master_password") for db_uid in db_uids if self._in_region(db_uid))
+
     @lru_cache(maxsize=None)
     def _get_mysql_provider(self, db_uid):
         """Returns a MySQL Pulumi provider specific to the database referenced by its UID."""
@@ -265,7 +380,33 @@ class Updater:
                               endpoint=f"{db.endpoint.address}:{db.endpoint.port}",
                               proxy=self.model.system.proxy,
                               username=db.master_username,
-                              password=pulumi.Output.secret(db.master_password))
+                              password=pulumi.Output.secret(resolve_secret(db.master_password)))
+
+
+def parse_shard(shard: str) -> Tuple[str, Optional[str]]:
+    """Parses a shard in the form `phase[:region]`, e.g. `mysql:eu-west-2` or `iam`."""
+    phase, _, region = shard.partition(":")
+    if phase not in PHASES:
+        raise ValueError(f"Unknown phase: {phase}")
+    if region and not PHASES[phase]:
+        raise ValueError(f"Phase {phase} is not region-specific")
+    return phase, (region or None)
+
+
+def sort_shards(shards: Iterable[str]) -> List[str]:
+    """Sorts the shards in the order of their phases, e.g. the roles granted by `applications:<region>` are declared
+    by `mysql:<region>`."""
+    phases = list(PHASES)
+    return sorted(shards, key=lambda shard: phases.index(parse_shard(shard)[0]))
+
+
+def _role_name(db_name: str, grant_type: str) -> str:
+    """A role name unique per db_name and grant type. Names too long are shortened with a hash suffix."""
+    name = f"sari_{grant_type}_{db_name}"
+    if len(name) > MAX_ROLE_NAME_LENGTH:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        name = f"{name[:MAX_ROLE_NAME_LENGTH - len(digest) - 1]}_{digest}"
+    return name
 
 
 def _get_sari_configuration_repo():
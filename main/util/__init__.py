@@ -1,13 +1,28 @@
+from .cache import (
+    FileCache,
+)
 from .dict import (
     assert_dict_equals,
     dict_deep_merge,
 )
+from .mysql_ext import (
+    SocketFactory,
+    mysql_connect,
+    socks_socket_factory,
+)
 from .pulumi_tools import (
+    get_mysql_provider_endpoints,
     purge_pulumi_stack,
 )
 from .request_ext import (
     async_retryable_session,
 )
+from .ssh_tunnel import (
+    SshTunnel,
+    load_private_key,
+)
 from .wildcard import (
+    Reference,
+    WildcardIndex,
     wc_expand,
 )
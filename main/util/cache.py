@@ -0,0 +1,38 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+
+class FileCache:
+    def __init__(self, cache_dir: Optional[str], namespace: str):
+        """
+        A persistent store of JSON-serializable values, kept across runs as one file per key.
+
+        :param cache_dir: The base directory of all caches. If not set the cache is always empty.
+        :param namespace: Name of the subdirectory holding the entries of this cache.
+        """
+        self.path = Path(cache_dir, namespace) if cache_dir else None
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.path:
+            return None
+        try:
+            return json.loads(self._entry(key).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: Any):
+        if not self.path:
+            return
+        self.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # Entries may hold secrets: only the owner can read them, and they are replaced atomically.
+        fd, tmp_name = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "w") as file:
+            json.dump(value, file, default=str)
+        os.replace(tmp_name, self._entry(key))
+
+    def _entry(self, key: str) -> Path:
+        return self.path / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
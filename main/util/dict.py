@@ -1,4 +1,5 @@
 from pprint import pformat
+from typing import Dict, Optional, Tuple
 
 from dictdiffer import diff
 
@@ -10,20 +11,39 @@ def assert_dict_equals(actual: dict, expected: dict):
         raise AssertionError("Dict diff:\n{}".format(pformat(differences)))
 
 
-def dict_deep_merge(a, b, path=None):
-    """merges dictionary b into a recursively"""
-    if path is None:
-        path = []
-    for key in b:
-        if key in a:
-            a_is_dict = isinstance(a[key], dict)
-            b_is_dict = isinstance(b[key], dict)
-            if a_is_dict and b_is_dict:
-                dict_deep_merge(a[key], b[key], path + [str(key)])
-            elif not a_is_dict and not b_is_dict:
-                a[key] = b[key]
-            else:
-                raise TypeError('Conflict at %s' % '.'.join(path + [str(key)]))
-        else:
-            a[key] = b[key]
+def dict_deep_merge(a, b, path=None, provenance: Optional[Dict[Tuple[str, ...], str]] = None,
+                    source: Optional[str] = None):
+    """
+    Merges dictionary b into a recursively.
+
+    :param path: The keys leading to a, only used to report conflicts.
+    :param provenance: If given, gets the `source` of every value set on a, by its path (the keys leading to it).
+    :raises TypeError: If a dict and a non-dict are found at the same place.
+    """
+    prefix = tuple(path or ())
+    # Each merge pending: (a, b, the key of both in their parents, the merge of their parents)
+    pending = [(a, b, None, None)]
+    while pending:
+        merge = pending.pop()
+        a_dict, b_dict = merge[0], merge[1]
+        for key, b_value in b_dict.items():
+            if key in a_dict:
+                a_is_dict = isinstance(a_dict[key], dict)
+                b_is_dict = isinstance(b_value, dict)
+                if a_is_dict and b_is_dict:
+                    pending.append((a_dict[key], b_value, key, merge))
+                    continue
+                if a_is_dict or b_is_dict:
+                    raise TypeError('Conflict at %s' % '.'.join((*prefix, *_merge_path(merge), str(key))))
+            a_dict[key] = b_value
+            if provenance is not None:
+                provenance[(*prefix, *_merge_path(merge), str(key))] = source
     return a
+
+
+def _merge_path(merge) -> Tuple[str, ...]:
+    keys = []
+    while merge[3] is not None:
+        keys.append(str(merge[2]))
+        merge = merge[3]
+    return tuple(reversed(keys))
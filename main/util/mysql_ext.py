@@ -0,0 +1,75 @@
+import socket
+from functools import partial
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlparse
+
+import mysql.connector
+# noinspection PyPackageRequirements
+import socks
+from mysql.connector import MySQLConnection
+from mysql.connector.errors import InterfaceError
+from mysql.connector.network import MySQLTCPSocket
+
+CR_CONN_HOST_ERROR = 2003
+
+# (address, timeout) -> connected socket, like `socket.create_connection()`
+SocketFactory = Callable[[Tuple[str, int], Optional[float]], socket.socket]
+
+
+def socks_socket_factory(proxy: str) -> SocketFactory:
+    """
+    Returns a socket factory connecting through the given SOCKS proxy, without touching the process-wide
+    `socket.socket`.
+
+    :param proxy: The proxy URL, e.g. `socks5://localhost:1080`
+    """
+    parts = urlparse(proxy)
+    proxy_type = socks.PROXY_TYPES[parts.scheme.upper()]
+    return partial(socks.create_connection, proxy_type=proxy_type, proxy_addr=parts.hostname,
+                   proxy_port=parts.port)
+
+
+def mysql_connect(socket_factory: Optional[SocketFactory] = None, read_timeout: Optional[float] = None,
+                  **kwargs) -> MySQLConnection:
+    """
+    Same as `mysql.connector.connect()`, but the connection socket is created by the given factory (if any).
+    The pure Python implementation of the connector is always used.
+
+    :param read_timeout: Timeout (in seconds) of each socket operation once connected. By default, the connector
+     blocks for as long as the server (or the network) doesn't answer.
+    """
+    if socket_factory is None and read_timeout is None:
+        return mysql.connector.connect(use_pure=True, **kwargs)
+    return _MySQLConnection(socket_factory or socket.create_connection, read_timeout, **kwargs)
+
+
+class _MySQLConnection(MySQLConnection):
+    def __init__(self, socket_factory: SocketFactory, read_timeout: Optional[float], **kwargs):
+        self._socket_factory = socket_factory
+        self._read_timeout = read_timeout
+        super().__init__(**kwargs)
+
+    def _get_connection(self, *args):
+        conn = _MySQLFactorySocket(self._socket_factory, self._read_timeout, host=self.server_host,
+                                   port=self.server_port)
+        conn.set_connection_timeout(self._connection_timeout)
+        return conn
+
+
+class _MySQLFactorySocket(MySQLTCPSocket):
+    def __init__(self, socket_factory: SocketFactory, read_timeout: Optional[float], **kwargs):
+        super().__init__(**kwargs)
+        self._socket_factory = socket_factory
+        self._read_timeout = read_timeout
+
+    def set_connection_timeout(self, timeout: Optional[float]):
+        # Once connected, the connector clears the timeout.
+        super().set_connection_timeout(self._read_timeout if timeout is None else timeout)
+
+    def open_connection(self):
+        try:
+            self.sock = self._socket_factory((self.server_host, self.server_port), self._connection_timeout)
+            self.sock.settimeout(self._connection_timeout)
+        except IOError as e:
+            raise InterfaceError(msg=f"Can't connect to MySQL server on '{self.server_host}:{self.server_port}' ({e})",
+                                 errno=CR_CONN_HOST_ERROR) from e
@@ -1,29 +1,42 @@
-import copy
 from typing import Set, Tuple
 
+MYSQL_PROVIDER_TYPE = "pulumi:providers:mysql"
+
+
+def get_mysql_provider_endpoints(stack: dict) -> Set[str]:
+    """The endpoints of the MySQL providers of a Pulumi Stack."""
+    return {resource["inputs"]["endpoint"] for resource in stack["deployment"].get("resources", [])
+            if resource["type"] == MYSQL_PROVIDER_TYPE}
+
 
 def purge_pulumi_stack(original_stack: dict, live_rds_endpoints: Set[str]) -> Tuple[dict, int]:
     """
-    Purge resources whose providers were deleted without prior knowledge.
+    Purge resources whose providers were deleted without prior knowledge, along with all the resources that depend
+    on them (as their provider, parent, or dependency), directly or not.
 
-    :param original_stack: The original Pulumi Stack.
+    :param original_stack: The original Pulumi Stack. Left untouched, but shares the live resources with the result.
     :param live_rds_endpoints: The RDS endpoints that are still valid.
     :return: The purged stack and the number of resources effectively purged.
     """
 
     def is_zombie_provider(resource) -> bool:
-        return resource["type"] == "pulumi:providers:mysql" and \
+        return resource["type"] == MYSQL_PROVIDER_TYPE and \
                resource["inputs"]["endpoint"] not in live_rds_endpoints
 
-    stack = copy.deepcopy(original_stack)
-    zombie_providers = set()
+    def depends_on_purged(resource) -> bool:
+        # A provider is referenced as "<urn>::<id>"
+        provider_urn = resource.get("provider", "").rpartition("::")[0]
+        return provider_urn in purged_urns or resource.get("parent") in purged_urns or \
+            any(urn in purged_urns for urn in resource.get("dependencies") or ())
+
+    # Pulumi keeps the resources in dependency order: each one is preceded by all the resources it depends on.
+    purged_urns = set()
     live_resources = []
-    resources = stack["deployment"].get("resources", [])
+    resources = original_stack["deployment"].get("resources", [])
     for res in resources:
-        if is_zombie_provider(res):
-            provider_canonical_reference = f"{res['urn']}::{res['id']}"
-            zombie_providers.add(provider_canonical_reference)
-        elif res.get("provider") not in zombie_providers:
+        if is_zombie_provider(res) or depends_on_purged(res):
+            purged_urns.add(res["urn"])
+        else:
             live_resources.append(res)
-    stack["deployment"]["resources"] = live_resources
+    stack = dict(original_stack, deployment=dict(original_stack["deployment"], resources=live_resources))
     return stack, len(resources) - len(live_resources)
@@ -1,23 +1,115 @@
+import time
 from concurrent.futures import ThreadPoolExecutor
+from threading import Condition
+from typing import Optional
 
-from requests.adapters import HTTPAdapter
+from requests import Response
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from requests_futures.sessions import FuturesSession
 from urllib3.util.retry import Retry
 
 SC_TOO_MANY_REQUESTS = 429
 
+# See https://developer.okta.com/docs/reference/rl-best-practices/
+X_RATE_LIMIT_REMAINING = "X-Rate-Limit-Remaining"
+X_RATE_LIMIT_RESET = "X-Rate-Limit-Reset"
+
+# Guards against a skewed clock (or a bogus reset time)
+MAX_RATE_LIMIT_PAUSE = 60
+
 
 def async_retryable_session(executor: ThreadPoolExecutor) -> FuturesSession:
     session = FuturesSession(executor)
+    # As many connections as requests possibly in flight.
+    # noinspection PyProtectedMember
+    max_workers = getattr(executor, "_max_workers", DEFAULT_POOLSIZE)
     retries = 3
     retry = Retry(
         total=retries,
         read=retries,
         connect=retries,
         backoff_factor=0.5,
-        status_forcelist=(SC_TOO_MANY_REQUESTS,),
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = RateLimitedAdapter(RateLimiter(max_workers), max_retries=retry, pool_maxsize=max_workers)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
+
+
+class RateLimiter:
+    def __init__(self, max_concurrency: int):
+        """
+        Bounds the number of requests in flight according to the rate limit reported by the server.
+
+        :param max_concurrency: The number of requests in flight while the rate limit is far from being reached.
+        """
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.resume_time = 0.0
+        self._condition = Condition()
+
+    def acquire(self):
+        """Wait until a new request is allowed."""
+        with self._condition:
+            while True:
+                pause = self.resume_time - time.time()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self.in_flight >= self.concurrency:
+                    self._condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+
+    def release(self, response: Optional[Response]):
+        """Account for a completed request, adapting the concurrency to the rate limit headers of its response."""
+        with self._condition:
+            self.in_flight -= 1
+            if response is not None:
+                self._adapt(response)
+            self._condition.notify_all()
+
+    def _adapt(self, response: Response):
+        remaining = _get_int_header(response, X_RATE_LIMIT_REMAINING)
+        reset_time = _get_int_header(response, X_RATE_LIMIT_RESET)
+        if response.status_code == SC_TOO_MANY_REQUESTS or remaining == 0:
+            # Pause until the rate limit window is reset.
+            if reset_time:
+                self.resume_time = max(self.resume_time, min(reset_time, time.time() + MAX_RATE_LIMIT_PAUSE))
+            self.concurrency = max(1, self.concurrency // 2)
+        elif remaining is not None:
+            if remaining < self.concurrency:
+                self.concurrency = remaining
+            elif self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    def __init__(self, limiter: RateLimiter, max_rate_limited_attempts: int = 3, **kwargs):
+        """
+        An HTTPAdapter that paces the requests with a `RateLimiter`. Rate limited requests are retried as soon as
+        the rate limit window is reset.
+        """
+        self.limiter = limiter
+        self.max_rate_limited_attempts = max_rate_limited_attempts
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=W0221
+        for attempt in range(1, self.max_rate_limited_attempts + 1):
+            response = None
+            self.limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            finally:
+                self.limiter.release(response)
+            if response.status_code != SC_TOO_MANY_REQUESTS or attempt == self.max_rate_limited_attempts:
+                return response
+            response.close()
+
+
+def _get_int_header(response: Response, name: str) -> Optional[int]:
+    try:
+        return int(response.headers[name])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,105 @@
+import socket
+from io import StringIO
+from threading import Lock
+from typing import Optional, Tuple
+
+from paramiko import ECDSAKey, Ed25519Key, PKey, RSAKey, SSHException
+from paramiko.client import AutoAddPolicy, SSHClient
+from paramiko.config import SSH_PORT
+from paramiko.transport import Transport
+
+SSH_CONNECT_TIMEOUT = 5
+SSH_KEEPALIVE_INTERVAL = 30
+
+# Reported to the bastion host as the originator of the forwarded connections
+LOCALHOST = ("127.0.0.1", 0)
+
+
+class SshTunnel:
+    def __init__(self, hostname: str, username: str, port: Optional[int] = None, pkey: Optional[PKey] = None,
+                 key_filename: Optional[str] = None, passphrase: Optional[str] = None):
+        """
+        A single SSH connection to a (bastion) host, carrying each forwarded connection as a `direct-tcpip` channel.
+        It's only established on its first use, and re-established if broken.
+        """
+        self.hostname = hostname
+        self.username = username
+        self.port = int(port or SSH_PORT)
+        self.pkey = pkey
+        self.key_filename = key_filename
+        self.passphrase = passphrase
+        self._client: Optional[SSHClient] = None
+        self._lock = Lock()
+
+    def create_connection(self, address: Tuple[str, int], timeout: Optional[float] = None) -> socket.socket:
+        """
+        Same as `socket.create_connection()`, but the connection is forwarded by the remote host. Can be used
+        as a `SocketFactory`.
+        """
+        try:
+            channel = self._get_transport().open_channel("direct-tcpip", dest_addr=tuple(address),
+                                                         src_addr=LOCALHOST, timeout=timeout)
+        except SSHException as e:
+            raise ConnectionError(f"SSH tunnel to {address[0]}:{address[1]} failed: {e}") from e
+        # noinspection PyTypeChecker
+        return _ChannelSocket(channel)
+
+    def close(self):
+        with self._lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_transport(self) -> Transport:
+        with self._lock:
+            transport = self._client and self._client.get_transport()
+            if not (transport and transport.is_active()):
+                client = SSHClient()
+                # noinspection ParamikoHostkeyBypass
+                client.set_missing_host_key_policy(AutoAddPolicy)
+                client.connect(self.hostname,
+                               port=self.port,
+                               timeout=SSH_CONNECT_TIMEOUT,
+                               banner_timeout=SSH_CONNECT_TIMEOUT,
+                               username=self.username,
+                               pkey=self.pkey,
+                               key_filename=self.key_filename,
+                               passphrase=self.passphrase,
+                               allow_agent=False,
+                               look_for_keys=False)
+                transport = client.get_transport()
+                transport.set_keepalive(SSH_KEEPALIVE_INTERVAL)
+                self._client = client
+            return transport
+
+
+def load_private_key(private_key: str, passphrase: Optional[str] = None) -> PKey:
+    """Loads a private key of any of the supported types from its text (PEM or OpenSSH) representation."""
+    for key_class in (RSAKey, Ed25519Key, ECDSAKey):
+        try:
+            return key_class.from_private_key(StringIO(private_key), password=passphrase)
+        except SSHException:
+            pass
+    raise SSHException("Unsupported or invalid private key")
+
+
+class _ChannelSocket:
+    """Exposes a Paramiko channel with the socket methods used by the MySQL connector."""
+    family = socket.AF_INET
+
+    def __init__(self, channel):
+        self._channel = channel
+
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        data = self._channel.recv(nbytes or len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
@@ -1,6 +1,8 @@
 import fnmatch
 import re
-from typing import List
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Pattern, Set, Tuple, Union
 
 _WILDCARD_CHECK = re.compile('([*?[])')
 
@@ -11,5 +13,75 @@ def wc_expand(name: str, names: List[str]) -> List[str]:
     return [name] if name in names else []
 
 
+# A reference either by name (pattern), or by selector: `{"tags": {key: value, ...}, "id": pattern}`
+Reference = Union[str, Dict[str, Any]]
+
+
+class WildcardIndex:
+    def __init__(self, names: Iterable[str], tags: Optional[Dict[str, Dict[str, str]]] = None):
+        """
+        Expands many (wildcard) references against the same names, e.g. the DB instance references of all users
+        against the UIDs of the enabled databases. Same results as `wc_expand()`, in the order of the names.
+
+        Exact references are looked up in a set. A pattern is only matched against the names sharing its literal
+        prefix (typically, its region), found by bisecting the sorted names. The expansion of each distinct
+        reference is computed only once.
+
+        :param tags: The tags of the names (if any), for the references by selector: the names having all the tags
+         of the selector, and matching its `id` pattern (if any).
+        """
+        self._positions: Dict[str, int] = {}
+        for name in names:
+            self._positions.setdefault(name, len(self._positions))
+        self._sorted_names = sorted(self._positions)
+        self._expansions: Dict[Any, List[str]] = {}
+        self._tagged: Dict[Tuple[str, str], Set[str]] = {}
+        for name, name_tags in (tags or {}).items():
+            if name in self._positions:
+                for tag in name_tags.items():
+                    self._tagged.setdefault(tag, set()).add(name)
+
+    def expand(self, reference: Reference) -> List[str]:
+        key = _selector_key(reference) if isinstance(reference, dict) else reference
+        expansion = self._expansions.get(key)
+        if expansion is None:
+            expansion = self._expansions[key] = \
+                self._select(reference) if isinstance(reference, dict) else self._expand(reference)
+        return list(expansion)
+
+    def _select(self, selector: Dict[str, Any]) -> List[str]:
+        tags = selector.get("tags") or {}
+        if not tags:
+            return self._expand(selector["id"]) if selector.get("id") else []
+        names = set.intersection(*(self._tagged.get((key, str(value)), set()) for key, value in tags.items()))
+        if selector.get("id"):
+            names.intersection_update(self._expand(selector["id"]))
+        return sorted(names, key=self._positions.__getitem__)
+
+    def _expand(self, name: str) -> List[str]:
+        match = _WILDCARD_CHECK.search(name)
+        if not match:
+            return [name] if name in self._positions else []
+        prefix = name[:match.start()]
+        pattern = _compile(name)
+        matches = []
+        for index in range(bisect_left(self._sorted_names, prefix), len(self._sorted_names)):
+            candidate = self._sorted_names[index]
+            if not candidate.startswith(prefix):
+                break
+            if pattern.match(candidate):
+                matches.append(candidate)
+        return sorted(matches, key=self._positions.__getitem__)
+
+
+def _selector_key(selector: Dict[str, Any]) -> Tuple[Optional[str], FrozenSet[Tuple[str, str]]]:
+    return selector.get("id"), frozenset((key, str(value)) for key, value in (selector.get("tags") or {}).items())
+
+
+@lru_cache(maxsize=None)
+def _compile(pattern: str) -> Pattern:
+    return re.compile(fnmatch.translate(pattern))
+
+
 def _has_magic(s):
     return _WILDCARD_CHECK.search(s) is not None
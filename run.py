@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from loguru import logger
+from pulumi.x.automation import CommandError
+
+from main.domain import log_issues
+from main.driver import PULUMI_ACTIONS, run_pulumi
+from main.gatherer import ModelBuilder
+from main.updater import ModelChanges
+
+
+def main():
+    """Builds the model and runs Pulumi on it in the same process, the model never leaving the memory."""
+    logger.remove()
+    logger.add(sys.stdout, colorize=(not in_automation()),
+               format="<green>{time:HH:mm:ss.SSS}</green> {level} <lvl>{message}</lvl>")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', nargs='?', choices=PULUMI_ACTIONS, default='preview',
+                        help='The Pulumi action to run.')
+    parser.add_argument('--yes', action='store_true',
+                        help='Ignored: Pulumi is never interactive here.')
+    parser.add_argument('--stack', default=os.environ.get("PULUMI_STACK_NAME"),
+                        help='Pulumi Stack (the base name of the shard stacks, if any).')
+    parser.add_argument('--shard', action='append', dest='shards', default=[],
+                        help='Update only this shard (e.g. mysql:eu-west-2) on its own stack. May be repeated.')
+    parser.add_argument('--purge-pulumi-stack', action='store_true',
+                        help='Purge zombie resources from Pulumi Stack.')
+    args = parser.parse_args()
+    if not args.stack:
+        parser.error("the Pulumi Stack is required (--stack or PULUMI_STACK_NAME)")
+
+    model, issues = ModelBuilder().build()
+    log_issues(issues)
+
+    try:
+        run_pulumi(model, args.stack, args.action, args.shards, args.purge_pulumi_stack,
+                   ModelChanges(model.system.cache_dir, args.stack))
+    except CommandError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+def in_automation():
+    return os.environ.get("CI") == "true"
+
+
+if __name__ == "__main__":
+    main()
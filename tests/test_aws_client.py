@@ -0,0 +1,75 @@
+import boto3
+from moto import mock_rds2, mock_s3
+
+from main.aws_client import AwsClient
+
+AWS_REGION = "eu-west-2"
+BUCKET_NAME = "acme-secrets"
+KEY = "rds/passwords.properties"
+
+
+@mock_s3
+def test_s3_get_property_fetched_once(monkeypatch):
+    # Given:
+    s3 = boto3.client("s3", region_name=AWS_REGION)
+    s3.create_bucket(Bucket=BUCKET_NAME, CreateBucketConfiguration={"LocationConstraint": AWS_REGION})
+    s3.put_object(Bucket=BUCKET_NAME, Key=KEY, Body=b"blackwells = focused_mendel\nwhsmith = quirky_ganguly\n")
+    monkeypatch.setattr(AwsClient, "_s3_properties", {})
+    aws_clients = [AwsClient(AWS_REGION), AwsClient("us-east-1")]
+    requests = []
+    for aws_client in aws_clients:
+        # noinspection PyProtectedMember
+        aws_client._get_client("s3").meta.events.register("before-call.s3.GetObject",
+                                                          lambda params, **kwargs: requests.append(params))
+
+    # When:
+    values = [aws_client.s3_get_property(BUCKET_NAME, KEY, name)[0]
+              for aws_client, name in zip(aws_clients, ("blackwells", "whsmith"))]
+    _, last_modified = aws_clients[0].s3_get_property(BUCKET_NAME, KEY, "whsmith")
+
+    # Then:
+    assert values == ["focused_mendel", "quirky_ganguly"]
+    assert last_modified.tzinfo
+    assert len(requests) == 1
+
+
+def test_clients_shared(monkeypatch):
+    # Given:
+    monkeypatch.setenv("AWS_DEFAULT_REGION", AWS_REGION)
+    AwsClient.configure(max_pool_connections=64, retry_mode="standard", max_attempts=3)
+
+    # When:
+    # noinspection PyProtectedMember
+    clients = [AwsClient(region)._get_client("ssm") for region in (AWS_REGION, None, "us-east-1")]
+
+    # Then:
+    AwsClient.configure()
+    assert clients[0] is clients[1]
+    assert clients[0] is not clients[2]
+    assert clients[2].meta.region_name == "us-east-1"
+    assert clients[0].meta.config.max_pool_connections == 64
+    assert clients[0].meta.config.retries == {"mode": "standard", "total_max_attempts": 3}
+
+
+@mock_rds2
+def test_rds_discover_endpoints(monkeypatch):
+    # Given:
+    rds = boto3.client("rds", region_name=AWS_REGION)
+    for db_id in ["blackwells", "foyles"]:
+        rds.create_db_instance(DBInstanceIdentifier=db_id, Engine="mysql", DBInstanceClass="db.m1.small")
+    monkeypatch.setattr(AwsClient, "_rds_known_endpoints", set())
+    # Only the configured instances are enumerated
+    list(AwsClient(AWS_REGION).rds_enum_databases("mysql", ["blackwells"]))
+    blackwells, foyles, whsmith = (f"{db_id}.aaaaaaaaaa.{AWS_REGION}.rds.amazonaws.com:3306"
+                                   for db_id in ("blackwells", "foyles", "whsmith"))
+    requests = []
+    # noinspection PyProtectedMember
+    AwsClient(AWS_REGION)._get_client("rds").meta.events.register(
+        "provide-client-params.rds.DescribeDBInstances", lambda params, **kwargs: requests.append(params))
+
+    # When:
+    live_endpoints = AwsClient.rds_discover_endpoints("mysql", [blackwells, foyles, whsmith, "whsmith.acme.com:3306"])
+
+    # Then:
+    assert live_endpoints == {blackwells, foyles}
+    assert [request["Filters"][1]["Values"] for request in requests] == [["foyles", "whsmith"]]
@@ -0,0 +1,37 @@
+import pytest
+
+from main.util import dict_deep_merge
+
+
+def test_dict_deep_merge_provenance():
+    # Given:
+    model = {"aws": {"databases": {"eu-west-2/blackwells": {"status": "ENABLED"}}}, "okta": {}}
+    provenance = {}
+
+    # When:
+    dict_deep_merge(model, {"aws": {"databases": {"eu-west-2/blackwells": {"status": "ACCESSIBLE", "permissions": {}},
+                                                  "eu-west-2/foyles": {"status": "DISABLED"}}}},
+                    provenance=provenance, source="MySqlGatherer")
+    dict_deep_merge(model, {"okta": {"users": {"alice": {"status": "ACTIVE"}}}},
+                    provenance=provenance, source="OktaGatherer")
+
+    # Then:
+    assert model == {
+        "aws": {"databases": {"eu-west-2/blackwells": {"status": "ACCESSIBLE", "permissions": {}},
+                              "eu-west-2/foyles": {"status": "DISABLED"}}},
+        "okta": {"users": {"alice": {"status": "ACTIVE"}}},
+    }
+    assert provenance == {
+        ("aws", "databases", "eu-west-2/blackwells", "status"): "MySqlGatherer",
+        ("aws", "databases", "eu-west-2/blackwells", "permissions"): "MySqlGatherer",
+        ("aws", "databases", "eu-west-2/foyles"): "MySqlGatherer",
+        ("okta", "users"): "OktaGatherer",
+    }
+
+
+def test_dict_deep_merge_conflict():
+    model = {"aws": {"databases": {"eu-west-2/blackwells": {"status": "ENABLED"}}}}
+    with pytest.raises(TypeError, match=r"^Conflict at aws\.databases\.eu-west-2/blackwells\.status$"):
+        dict_deep_merge(model, {"aws": {"databases": {"eu-west-2/blackwells": {"status": {"name": "ENABLED"}}}}})
+    with pytest.raises(TypeError, match=r"^Conflict at model\.aws$"):
+        dict_deep_merge(model, {"aws": None}, path=["model"])
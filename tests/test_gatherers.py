@@ -1,11 +1,14 @@
+import json
 import random
 import re
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures.thread import ThreadPoolExecutor
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from io import StringIO
+from multiprocessing import get_context
 from pathlib import Path
 from typing import List, Tuple
-from urllib.parse import unquote
+from urllib.parse import parse_qs, unquote, urlencode
 
 import boto3
 import pytest
@@ -17,13 +20,15 @@ from moto.iam.models import ACCOUNT_ID
 from prodict import Prodict
 
 from main.aws_client import AwsClient
-from main.domain import IssueLevel
+from main.domain import Issue, IssueLevel
 from main.gatherer.aws import AwsGatherer
 from main.gatherer.config import DatabaseConfigGatherer, UserConfigGatherer, ServiceConfigGatherer, \
-    ApplicationConfigGatherer
+    ApplicationConfigGatherer, _with_default_region
 from main.gatherer.dbinfo import DatabaseInfoGatherer
-from main.gatherer.okta import OktaGatherer
+from main.gatherer.okta import OktaGatherer, OktaGroupGatherer
 from main.gatherer.pwd_resolver import MasterPasswordResolver
+from main.gatherer.region import RegionGatherer
+from main.secret_ref import SecretResolver
 from main.util import dict_deep_merge, assert_dict_equals
 
 AWS_REGION_US = "us-east-1"
@@ -193,6 +198,64 @@ class TestGatherers:
             assert issues[index].id == f"{region}/{id_}"
         assert_dict_equals(resp, {"aws": {"databases": local_databases}})
 
+    @mock_ssm
+    def test_pwd_resolver_prefetch(self, monkeypatch):
+        # Given:
+        region = AWS_REGION_UK
+        ssm = boto3.client("ssm", region_name=region)
+        db_ids = [f"waterstones-{index}" for index in range(12)]
+        for db_id in db_ids:
+            ssm.put_parameter(Name=f"{db_id}.master_password", Value=f"{db_id}-pwd", Type="SecureString")
+        aws_client = AwsClient(region)
+        pwd_resolver = MasterPasswordResolver(aws_client, MASTER_PASSWORD_DEFAULTS)
+        batches = []
+        get_parameters = aws_client.ssm_get_encrypted_parameters
+        monkeypatch.setattr(aws_client, "ssm_get_encrypted_parameters",
+                            lambda names: batches.append(names) or get_parameters(names))
+        monkeypatch.setattr(aws_client, "ssm_get_encrypted_parameter", None)
+
+        # When:
+        pwd_resolver.prefetch([(db_id, None) for db_id in db_ids] + [("hatchards", "ssm:hatchards.pwd")])
+
+        # Then:
+        assert len(batches) == 1
+        for db_id in db_ids:
+            assert pwd_resolver.resolve(db_id, None)[0] == f"{db_id}-pwd"
+        with pytest.raises(ValueError, match="hatchards.pwd"):
+            pwd_resolver.resolve("hatchards", "ssm:hatchards.pwd")
+
+    @mock_ssm
+    def test_pwd_resolver_lazy(self, monkeypatch):
+        # Given:
+        region = AWS_REGION_UK
+        ssm = boto3.client("ssm", region_name=region)
+        ssm.put_parameter(Name="foyles.master_password", Value="foyles-pwd", Type="SecureString")
+        aws_client = AwsClient(region)
+        pwd_resolver = MasterPasswordResolver(aws_client, MASTER_PASSWORD_DEFAULTS, lazy=True)
+        monkeypatch.setattr(aws_client, "ssm_get_encrypted_parameters", None)
+        monkeypatch.setattr(aws_client, "ssm_get_encrypted_parameter", None)
+        resolver = SecretResolver()
+        fetched = []
+        get_parameter = AwsClient.ssm_get_encrypted_parameter
+        monkeypatch.setattr(AwsClient, "ssm_get_encrypted_parameter",
+                            lambda self, name: fetched.append(name) or get_parameter(self, name))
+
+        # When:
+        pwd_resolver.prefetch([("foyles", None)])
+        foyles_pwd, foyles_pwd_age = pwd_resolver.resolve("foyles", None)
+        hatchards_pwd, _ = pwd_resolver.resolve("hatchards", "plain-pwd")
+
+        # Then:
+        assert foyles_pwd == {"secret": "ssm:foyles.master_password", "region": region}
+        assert foyles_pwd_age is None
+        assert hatchards_pwd == "plain-pwd"
+        assert resolver.resolve(Prodict.from_dict(foyles_pwd)) == "foyles-pwd"
+        assert resolver.resolve(dict(foyles_pwd)) == "foyles-pwd"
+        assert resolver.resolve(hatchards_pwd) == "plain-pwd"
+        assert fetched == ["foyles.master_password"]
+        with pytest.raises(Exception, match="whsmith"):
+            resolver.resolve({"secret": "ssm:whsmith.master_password", "region": region})
+
     @mock_ec2
     @mock_rds2
     @pytest.mark.parametrize("region, present_instances, absent_instances", [
@@ -220,6 +283,13 @@ class TestGatherers:
                 VpcSecurityGroupIds=[random_security_group_id()],
                 DBSubnetGroupName="db_subnet",
             )
+        # Not even listed
+        rds.create_db_instance(
+            DBInstanceIdentifier="waterstones",
+            Engine="postgres",
+            DBInstanceClass="db.m1.small",
+            DBSubnetGroupName="db_subnet",
+        )
         aws = AwsClient(region)
         gatherer = DatabaseInfoGatherer(aws, MasterPasswordResolver(aws, MASTER_PASSWORD_DEFAULTS))
         model = initial_model()
@@ -240,6 +310,109 @@ class TestGatherers:
             assert issues[index].id == f"{region}/{db_id}"
         assert_dict_equals(resp, {"aws": {"databases": local_databases}})
 
+    @mock_ec2
+    @mock_rds2
+    def test_aws_gather_rds_info_configured_only(self, monkeypatch):
+        # Given:
+        region = AWS_REGION_UK
+        _create_subnets("db_subnet", region, "10.0.0.0/16", [("a", "10.0.1.0/24"), ("b", "10.0.2.0/24")])
+        rds = boto3.client("rds", region_name=region)
+        for db_id in ["acme-test", "blackwells", "foyles"]:
+            rds.create_db_instance(
+                DBInstanceIdentifier=db_id,
+                Engine="mysql",
+                DBName=f"db_{db_id}",
+                MasterUsername="acme",
+                DBInstanceClass="db.m1.small",
+                AvailabilityZone=f"{AWS_REGION_UK}a",
+                VpcSecurityGroupIds=RDS_INFO_DATABASES[f"{region}/blackwells"]["vpc_security_group_ids"],
+                DBSubnetGroupName="db_subnet",
+            )
+        monkeypatch.setattr("main.aws_client.RDS_FILTER_MAX_VALUES", 2)
+        aws = AwsClient(region)
+        filters = []
+        # noinspection PyProtectedMember
+        aws._get_client("rds").meta.events.register("provide-client-params.rds.DescribeDBInstances",
+                                                    lambda params, **kwargs: filters.append(params["Filters"]))
+        gatherer = DatabaseInfoGatherer(aws, MasterPasswordResolver(aws, MASTER_PASSWORD_DEFAULTS), auto_enable=False)
+        model = initial_model()
+        model.aws["databases"] = Prodict.from_dict(RDS_CONFIG_DATABASES)
+
+        # When:
+        resp, issues = gatherer.gather(model)
+
+        # Then:
+        AwsClient.configure()
+        assert issues == [Issue(level=IssueLevel.ERROR, type="DB", id=f"{region}/whsmith", message="Not found in AWS")]
+        assert sorted(resp.aws.databases) == [f"{region}/blackwells", f"{region}/whsmith"]
+        assert [f[1]["Values"] for f in filters] == [["blackwells", "foyles"], ["whsmith"]]
+        assert any(endpoint.startswith("foyles.") for endpoint in AwsClient.get_rds_known_endpoints())
+
+    @mock_ec2
+    @mock_rds2
+    def test_aws_gather_rds_info_tags(self):
+        # Given:
+        region = AWS_REGION_UK
+        _create_subnets("db_subnet", region, "10.0.0.0/16", [("a", "10.0.1.0/24"), ("b", "10.0.2.0/24")])
+        rds = boto3.client("rds", region_name=region)
+        for db_id, tags in [("blackwells", [{"Key": "team", "Value": "books"}]), ("whsmith", [])]:
+            rds.create_db_instance(
+                DBInstanceIdentifier=db_id,
+                Engine="mysql",
+                DBName=f"db_{db_id}",
+                MasterUsername="acme",
+                DBInstanceClass="db.m1.small",
+                AvailabilityZone=f"{AWS_REGION_UK}a",
+                VpcSecurityGroupIds=RDS_INFO_DATABASES[f"{region}/blackwells"]["vpc_security_group_ids"],
+                DBSubnetGroupName="db_subnet",
+                Tags=tags,
+            )
+        aws = AwsClient(region)
+        gatherer = DatabaseInfoGatherer(aws, MasterPasswordResolver(aws, MASTER_PASSWORD_DEFAULTS))
+        model = initial_model()
+        model.aws["databases"] = Prodict.from_dict(RDS_CONFIG_DATABASES)
+
+        # When:
+        resp, _ = gatherer.gather(model)
+
+        # Then:
+        assert resp.aws.databases[f"{region}/blackwells"]["tags"] == {"team": "books"}
+        assert "tags" not in resp.aws.databases[f"{region}/whsmith"]
+
+    @mock_ec2
+    @mock_rds2
+    @mock_ssm
+    def test_region_gather_shard(self):
+        # Given:
+        region = AWS_REGION_UK
+        _create_region_shard(region)
+
+        # When:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            gatherer = RegionGatherer(region, f"tests/data/{region}/databases.yaml", MASTER_PASSWORD_DEFAULTS,
+                                      {}, executor)
+            resp, issues = gatherer.gather(initial_model())
+
+        # Then:
+        _assert_region_shard(region, resp, issues)
+
+    def test_region_gather_shard_on_process(self):
+        # Given:
+        region = AWS_REGION_UK
+        AwsClient.get_rds_known_endpoints().clear()
+
+        # When:
+        # The AWS resources are mocked by the spawned process itself. Both the arguments of the shard and its results
+        # are pickled.
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn"),
+                                 initializer=_mock_region_shard, initargs=(region,)) as executor:
+            gatherer = RegionGatherer(region, f"tests/data/{region}/databases.yaml", MASTER_PASSWORD_DEFAULTS,
+                                      {"max_attempts": 1}, executor)
+            resp, issues = gatherer.gather(initial_model())
+
+        # Then:
+        _assert_region_shard(region, resp, issues)
+
     def test_cfg_gather_empty_user_config(self):
         # Given:
         model = initial_model()
@@ -381,6 +554,54 @@ class TestGatherers:
             },
         })
 
+    def test_cfg_gather_user_config_groups(self):
+        # Given:
+        model = initial_model()
+        model.aws["single_region"] = AWS_REGION_UK
+        model.aws["databases"] = Prodict.from_dict({
+            f"{AWS_REGION_UK}/blackwells": {
+                "status": "ACCESSIBLE",
+                "db_name": "db_blackwells",
+            },
+        })
+        user_config = UserConfigGatherer(StringIO(f"""
+- group: dba-team
+  default_grant_type: crud
+  permissions:
+    - db: "*"
+- group: interns
+  permissions:
+    - db: "foyles"
+- login: leroy.trent@acme.com
+  group: dba-team
+- default_grant_type: query
+        """))
+
+        # When:
+        resp, issues = user_config.gather(model)
+
+        # Then:
+        assert [(issue.type, issue.id) for issue in issues] == [
+            ("GROUP", "interns"),
+            ("USER", "leroy.trent@acme.com"),
+            ("USER", "#4"),
+        ]
+        assert_dict_equals(resp, {
+            "okta": {
+                "users": {},
+                "groups": {
+                    "dba-team": {
+                        "permissions": {
+                            f"{AWS_REGION_UK}/blackwells": {"db_names": ["db_blackwells"], "grant_type": "crud"},
+                        },
+                    },
+                },
+            },
+            "aws": {
+                "databases": {},
+            },
+        })
+
     def test_cfg_gather_service_config(self):
         # Given:
         model = initial_model()
@@ -416,6 +637,60 @@ class TestGatherers:
             "monitoring": ["us-east-1/borders", "eu-west-2/blackwells"]
         }})
 
+    def test_cfg_with_default_region(self):
+        assert _with_default_region("blackwells", AWS_REGION_UK) == f"{AWS_REGION_UK}/blackwells"
+        assert _with_default_region(f"{AWS_REGION_US}/borders", AWS_REGION_UK) == f"{AWS_REGION_US}/borders"
+        assert _with_default_region({"id": "black*", "tags": {"team": "books"}}, AWS_REGION_UK) == \
+               {"id": f"{AWS_REGION_UK}/black*", "tags": {"team": "books"}}
+        assert _with_default_region({"id": f"{AWS_REGION_US}/*"}, AWS_REGION_UK) == {"id": f"{AWS_REGION_US}/*"}
+        assert _with_default_region({"tags": {"team": "books"}}, AWS_REGION_UK) == {"tags": {"team": "books"}}
+
+    def test_cfg_gather_tag_selectors(self, tmp_path):
+        # Given:
+        model = initial_model()
+        model.aws["databases"] = dict_deep_merge(Prodict.from_dict(RDS_CONFIG_DATABASES), RDS_INFO_DATABASES)
+        for db_uid in (f"{AWS_REGION_US}/borders", f"{AWS_REGION_UK}/blackwells"):
+            model.aws.databases[db_uid]["tags"] = {"team": "books", "env": "prod" if "borders" in db_uid else "dev"}
+        # Tagged, but not enabled
+        model.aws.databases[f"{AWS_REGION_UK}/foyles"]["tags"] = {"team": "books"}
+        user_config = UserConfigGatherer(StringIO("""
+- login: leroy.trent@acme.com
+  permissions:
+    - db: {tags: {team: books}}
+    - db: {id: "eu-west-2/*", tags: {team: books}}
+      grant_type: crud
+        """))
+        services_yaml = tmp_path / "services.yaml"
+        services_yaml.write_text("""
+glue_connections:
+  - db: {tags: {team: books, env: prod}}
+        """)
+        svc_config = ServiceConfigGatherer(str(services_yaml))
+        applications_yaml = tmp_path / "applications.yaml"
+        applications_yaml.write_text("""
+- name: monitoring
+  db: {tags: {team: books}}
+- name: reporting
+  db: {tags: {team: music}}
+        """)
+        app_config = ApplicationConfigGatherer(str(applications_yaml))
+
+        # When:
+        user_resp, user_issues = user_config.gather(model)
+        svc_resp, svc_issues = svc_config.gather(model)
+        app_resp, app_issues = app_config.gather(model)
+
+        # Then:
+        assert not user_issues
+        assert user_resp.okta.users["leroy.trent@acme.com"]["permissions"] == {
+            f"{AWS_REGION_US}/borders": {"db_names": ["db_borders"], "grant_type": "query"},
+            f"{AWS_REGION_UK}/blackwells": {"db_names": ["db_blackwells"], "grant_type": "crud"},
+        }
+        assert not svc_issues
+        assert list(svc_resp.aws.glue_connections) == [f"{AWS_REGION_US}/borders"]
+        assert [(issue.type, issue.id) for issue in app_issues] == [("APP", "reporting")]
+        assert app_resp.applications == {"monitoring": [f"{AWS_REGION_US}/borders", f"{AWS_REGION_UK}/blackwells"]}
+
     def test_okta_gather_no_users_info(self):
         # Given:
         model = initial_model()
@@ -435,16 +710,7 @@ class TestGatherers:
 
     def test_okta_gather_user_info(self):
         # Given:
-        model = initial_model()
-        model.okta.update(Prodict(users=USERS_CONFIG))
-        model.okta.users["tracy.mickelsen@acme.com"] = {
-            "db_username": "tracy.mickelsen@acme.com",
-            "permissions": {},
-        }
-        model.okta.users["miguel.heidler@acme.com"] = {
-            "db_username": "miguel.heidler@acme.com",
-            "permissions": {},
-        }
+        model = _okta_model()
 
         query_prefix = r"^limit=1&search=profile\.login\+eq\+"
 
@@ -471,39 +737,255 @@ class TestGatherers:
                 resp, issues = okta_gatherer.gather(model)
 
         # Then:
-        assert len(issues) == 3
-        assert issues[0].level == IssueLevel.ERROR
-        assert issues[0].type == "USER"
-        assert issues[0].id == "valerie.tennant@acme.com"
-        assert issues[1].level == IssueLevel.ERROR
-        assert issues[1].type == "USER"
-        assert issues[1].id == "tracy.mickelsen@acme.com"
-        assert issues[2].level == IssueLevel.ERROR
-        assert issues[2].type == "USER"
-        assert issues[2].id == "miguel.heidler@acme.com"
-        assert_dict_equals(resp, {"okta": {"users": {
-            "valerie.tennant@acme.com": {
-                "status": "MISSING_SSH_PUBKEY",
-            },
-            "miguel.heidler@acme.com": {
-                "status": "DEPROVISIONED",
-            },
-            "leroy.trent@acme.com": {
-                "status": "ACTIVE",
-                "user_id": "00m6q2lgisjgmFq64772",
-                "ssh_pubkey": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIEfzjdkO1LKnS/it62jmw9tH4BznlnDCBrzaKguujJ15 "
-                              "leroy.trent@acme.com",
-            },
-            "bridget.huntington-whiteley@acme.com": {
-                "status": "ACTIVE",
-                "user_id": "00u4subrvCRYYe2dx765",
-                "ssh_pubkey": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGD13Dbe1QoYrFZqCue1TzGkzDSra9ZHzv8gZy9+vb0Y "
-                              "bridget.huntington-whiteley@acme.com",
-            },
-            "tracy.mickelsen@acme.com": {
-                "status": "ABSENT",
-            }
-        }}})
+        _assert_okta_users_ext(resp, issues)
+
+    def test_okta_gather_user_info_bulk(self):
+        # Given:
+        model = _okta_model()
+        requests = []
+
+        @urlmatch(scheme="https", netloc="acme.okta.com", path=r"^/api/v1/users")
+        def okta_users_search(url, request):
+            assert request.headers["Authorization"] == f"SSWS {OKTA_API_TOKEN}"
+            requests.append(url)
+            query = parse_qs(url.query)
+            assert query["limit"] == ["200"]
+            users = []
+            for username in re.findall(r'profile\.login eq "(.*?)@acme\.com"', query["search"][0]):
+                user_file = Path(f"tests/data/users/{username}.json")
+                if user_file.exists():
+                    users.extend(json.loads(user_file.read_text()))
+            # One user per page
+            after = int(query.get("after", ["0"])[0])
+            headers = {"Content-Type": "application/json"}
+            if after + 1 < len(users):
+                next_query = urlencode(dict(limit=200, search=query["search"][0], after=after + 1))
+                headers["Link"] = f'<https://acme.okta.com/api/v1/users?{next_query}>; rel="next"'
+            return response(status_code=200, content=json.dumps(users[after:after + 1]), headers=headers)
+
+        # When:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            okta_gatherer = OktaGatherer(OKTA_API_TOKEN, executor, bulk_size=2)
+            with HTTMock(okta_users_search):
+                resp, issues = okta_gatherer.gather(model)
+
+        # Then:
+        assert len(requests) == 4
+        _assert_okta_users_ext(resp, issues)
+
+    def test_okta_gather_user_info_incremental(self, tmp_path):
+        # Given:
+        model = _okta_model()
+        requests = []
+
+        @urlmatch(scheme="https", netloc="acme.okta.com", path=r"^/api/v1/users")
+        def okta_users_search(url, request):
+            requests.append(url)
+            search = parse_qs(url.query)["search"][0]
+            if search.startswith("lastUpdated gt "):
+                assert re.match(r'^lastUpdated gt "\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.000Z"$', search)
+                leroy = json.loads(Path("tests/data/users/leroy.trent.json").read_text())
+                leroy[0]["status"] = "SUSPENDED"
+                content = json.dumps(leroy)
+            else:
+                username = re.match(r'^profile\.login eq "(.*)@acme\.com"$', search).group(1)
+                user_file = Path(f"tests/data/users/{username}.json")
+                content = user_file.read_text() if user_file.exists() else "[]"
+            return response(status_code=200, content=content, headers={"Content-Type": "application/json"})
+
+        # When:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            okta_gatherer = OktaGatherer(OKTA_API_TOKEN, executor, cache_dir=str(tmp_path))
+            with HTTMock(okta_users_search):
+                okta_gatherer.gather(model)
+                num_full_requests = len(requests)
+                resp, issues = okta_gatherer.gather(model)
+                num_incremental_requests = len(requests) - num_full_requests
+                # ... once the cached users expired
+                OktaGatherer(OKTA_API_TOKEN, executor, cache_dir=str(tmp_path),
+                             full_sync_interval=timedelta(0)).gather(model)
+
+        # Then:
+        assert num_full_requests == 5
+        # The updated users, then the absent one.
+        assert num_incremental_requests == 2
+        assert len(requests) == 2 * num_full_requests + num_incremental_requests
+        assert [issue.id for issue in issues] == ["leroy.trent@acme.com", "valerie.tennant@acme.com",
+                                                  "tracy.mickelsen@acme.com", "miguel.heidler@acme.com"]
+        assert resp.okta.users["leroy.trent@acme.com"] == {"status": "SUSPENDED"}
+        assert resp.okta.users["bridget.huntington-whiteley@acme.com"].status == "ACTIVE"
+
+    def test_okta_gather_group_members(self):
+        # Given:
+        model = initial_model()
+        model.okta["users"] = Prodict.from_dict({
+            "valerie.tennant@acme.com": USERS_CONFIG["valerie.tennant@acme.com"],
+        })
+        blackwells_query = {"db_names": ["db_blackwells"], "grant_type": "query"}
+        borders_crud = {"db_names": ["db_borders"], "grant_type": "crud"}
+        model.okta["groups"] = Prodict.from_dict({
+            "dba-team": {"permissions": {f"{AWS_REGION_UK}/blackwells": blackwells_query}},
+            "borders-team": {"permissions": {f"{AWS_REGION_US}/borders": borders_crud}},
+            "ghosts": {"permissions": {}},
+        })
+        members = {
+            "00g1": ["leroy.trent", "valerie.tennant", "miguel.heidler"],
+            "00g2": ["leroy.trent"],
+        }
+
+        @urlmatch(scheme="https", netloc="acme.okta.com", path=r"^/api/v1/groups")
+        def okta_groups(url, request):
+            assert request.headers["Authorization"] == f"SSWS {OKTA_API_TOKEN}"
+            if url.path == "/api/v1/groups":
+                name = parse_qs(url.query)["q"][0]
+                groups = [{"id": group_id, "profile": {"name": group_name}}
+                          for group_id, group_name in [("00g1", "dba-team"), ("00g2", "borders-team")]
+                          if group_name.startswith(name)]
+                content = json.dumps(groups)
+            else:
+                group_id = re.match(r"^/api/v1/groups/(\w+)/users$", url.path).group(1)
+                content = json.dumps([user for username in members[group_id]
+                                      for user in json.loads(Path(f"tests/data/users/{username}.json").read_text())])
+            return response(status_code=200, content=content, headers={"Content-Type": "application/json"})
+
+        # When:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            okta_gatherer = OktaGroupGatherer(OKTA_API_TOKEN, executor)
+            with HTTMock(okta_groups):
+                resp, issues = okta_gatherer.gather(model)
+
+        # Then:
+        assert [(issue.type, issue.id) for issue in issues] == [
+            ("GROUP", "ghosts"),
+            ("USER", "miguel.heidler@acme.com"),
+        ]
+        assert_dict_equals(resp, {
+            "okta": {"users": {
+                "leroy.trent@acme.com": {
+                    "status": "ACTIVE",
+                    "user_id": "00m6q2lgisjgmFq64772",
+                    "ssh_pubkey": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIEfzjdkO1LKnS/it62jmw9tH4BznlnDCBrzaKguujJ15 "
+                                  "leroy.trent@acme.com",
+                    "db_username": "leroy.trent@acme.com",
+                    "permissions": {
+                        f"{AWS_REGION_UK}/blackwells": blackwells_query,
+                        f"{AWS_REGION_US}/borders": borders_crud,
+                    },
+                },
+                "miguel.heidler@acme.com": {
+                    "status": "DEPROVISIONED",
+                    "db_username": "miguel.heidler@acme.com",
+                    "permissions": {
+                        f"{AWS_REGION_UK}/blackwells": blackwells_query,
+                    },
+                },
+            }},
+            "aws": {"databases": {
+                f"{AWS_REGION_UK}/blackwells": {"permissions": {
+                    "leroy.trent@acme.com": blackwells_query,
+                    "miguel.heidler@acme.com": blackwells_query,
+                }},
+                f"{AWS_REGION_US}/borders": {"permissions": {
+                    "leroy.trent@acme.com": borders_crud,
+                }},
+            }},
+        })
+
+
+def _okta_model() -> Prodict:
+    model = initial_model()
+    model.okta.update(Prodict(users=USERS_CONFIG))
+    model.okta.users["tracy.mickelsen@acme.com"] = {
+        "db_username": "tracy.mickelsen@acme.com",
+        "permissions": {},
+    }
+    model.okta.users["miguel.heidler@acme.com"] = {
+        "db_username": "miguel.heidler@acme.com",
+        "permissions": {},
+    }
+    return model
+
+
+def _assert_okta_users_ext(resp: Prodict, issues: List[Issue]):
+    assert len(issues) == 3
+    assert issues[0].level == IssueLevel.ERROR
+    assert issues[0].type == "USER"
+    assert issues[0].id == "valerie.tennant@acme.com"
+    assert issues[1].level == IssueLevel.ERROR
+    assert issues[1].type == "USER"
+    assert issues[1].id == "tracy.mickelsen@acme.com"
+    assert issues[2].level == IssueLevel.ERROR
+    assert issues[2].type == "USER"
+    assert issues[2].id == "miguel.heidler@acme.com"
+    assert_dict_equals(resp, {"okta": {"users": {
+        "valerie.tennant@acme.com": {
+            "status": "MISSING_SSH_PUBKEY",
+        },
+        "miguel.heidler@acme.com": {
+            "status": "DEPROVISIONED",
+        },
+        "leroy.trent@acme.com": {
+            "status": "ACTIVE",
+            "user_id": "00m6q2lgisjgmFq64772",
+            "ssh_pubkey": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIEfzjdkO1LKnS/it62jmw9tH4BznlnDCBrzaKguujJ15 "
+                          "leroy.trent@acme.com",
+        },
+        "bridget.huntington-whiteley@acme.com": {
+            "status": "ACTIVE",
+            "user_id": "00u4subrvCRYYe2dx765",
+            "ssh_pubkey": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGD13Dbe1QoYrFZqCue1TzGkzDSra9ZHzv8gZy9+vb0Y "
+                          "bridget.huntington-whiteley@acme.com",
+        },
+        "tracy.mickelsen@acme.com": {
+            "status": "ABSENT",
+        }
+    }}})
+
+
+def _create_region_shard(region: str):
+    _create_subnets("db_subnet", region, "10.0.0.0/16", [("a", "10.0.1.0/24"), ("b", "10.0.2.0/24")])
+    rds = boto3.client("rds", region_name=region)
+    for db_id in ["blackwells", "foyles"]:
+        rds.create_db_instance(
+            DBInstanceIdentifier=db_id,
+            Engine="mysql",
+            DBName=f"db_{db_id}",
+            MasterUsername="acme",
+            DBInstanceClass="db.m1.small",
+            VpcSecurityGroupIds=RDS_INFO_DATABASES[f"{region}/blackwells"]["vpc_security_group_ids"],
+            DBSubnetGroupName="db_subnet",
+        )
+    ssm = boto3.client("ssm", region_name=region)
+    for db_id in ["blackwells", "whsmith"]:
+        ssm.put_parameter(
+            Name=f"{db_id}.master_password",
+            Value=RDS_CONFIG_DATABASES[f"{region}/{db_id}"]["master_password"],
+            Type="SecureString"
+        )
+
+
+def _mock_region_shard(region: str):
+    """Initializer of the processes gathering a shard, as they don't inherit the mocks of the parent process."""
+    for mock in [mock_ec2(), mock_rds2(), mock_ssm()]:
+        mock.start()
+    _create_region_shard(region)
+
+
+def _assert_region_shard(region: str, resp: Prodict, issues: List[Issue]):
+    blackwells_uid = f"{region}/blackwells"
+    whsmith_uid = f"{region}/whsmith"
+    assert [(issue.level, issue.id) for issue in issues] == [
+        (IssueLevel.ERROR, f"{region}/daunt-books"),
+        (IssueLevel.ERROR, whsmith_uid),
+    ]
+    assert_dict_equals(resp, {"aws": {"databases": {
+        blackwells_uid: dict_deep_merge(dict(RDS_CONFIG_DATABASES[blackwells_uid]),
+                                        RDS_INFO_DATABASES[blackwells_uid]),
+        f"{region}/foyles": {"status": "DISABLED"},
+        whsmith_uid: dict(RDS_CONFIG_DATABASES[whsmith_uid], status="ABSENT"),
+    }}})
+    assert RDS_INFO_DATABASES[blackwells_uid]["endpoint"]["address"] + ":3306" in \
+           AwsClient.get_rds_known_endpoints()
 
 
 def _create_subnets(name: str,
@@ -1,10 +1,17 @@
-from concurrent.futures.thread import ThreadPoolExecutor
+import socket
+import time
 
 import pytest
 from prodict import Prodict
 from testcontainers.mysql import MySqlContainer
 
+import main.gatherer.grants as grants_gatherer_module
+import main.gatherer.mysql as mysql_gatherer_module
+from main.domain import IssueLevel
+from main.gatherer.grants import ALL_SCHEMA_PRIVILEGES, SARI_MANAGED_ROLE_GRANTS_QUERY, MySqlGrantsGatherer, \
+    to_grants
 from main.gatherer.mysql import MySqlGatherer
+from main.util.mysql_ext import _MySQLFactorySocket
 from tests.test_gatherers import assert_dict_equals
 
 
@@ -25,20 +32,257 @@ def test_mysql_gather_rds_status():
                         MYSQL_DATABASE=db_name,
                         MYSQL_USER=username,
                         MYSQL_PASSWORD=password) as mysql:
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            mysql_gatherer = MySqlGatherer(executor, None)
-            model = Prodict(aws={
-                "databases": {
-                    "blackwells": {
-                        "endpoint": {
-                            "address": "localhost",
-                            "port": mysql.get_exposed_port(3306),
-                        },
-                        "master_username": username,
-                        "master_password": password,
-                    }
+        mysql_gatherer = MySqlGatherer(None)
+        model = Prodict(aws={
+            "databases": {
+                "blackwells": {
+                    "endpoint": {
+                        "address": "localhost",
+                        "port": mysql.get_exposed_port(3306),
+                    },
+                    "master_username": username,
+                    "master_password": password,
                 }
-            })
-            updates, issues = mysql_gatherer.gather(model)
+            }
+        })
+        updates, issues = mysql_gatherer.gather(model)
     assert not issues
     assert_dict_equals(updates, {"aws": {"databases": {"blackwells": {"status": "ACCESSIBLE"}}}})
+
+
+def test_mysql_gather_rds_status_deadline(monkeypatch):
+    # Given:
+    delays = {"foyles": 1.5, "blackwells": 0.6, "whsmith": 0.6, "waterstones": 0}
+    running = []
+    max_running = []
+
+    def check_mysql_instance(db, **kwargs):
+        running.append(db)
+        max_running.append(len(running))
+        time.sleep(db.delay)
+        running.remove(db)
+        return True, f"OK after {db.delay}s"
+
+    monkeypatch.setattr(mysql_gatherer_module, "_check_mysql_instance", check_mysql_instance)
+    model = Prodict(aws={
+        "databases": {
+            **{db_id: {"endpoint": {"address": db_id, "port": 3306}, "delay": delay}
+               for db_id, delay in delays.items()},
+            "daunt-books": {"status": "ABSENT"},
+        }
+    })
+    completed = []
+    monkeypatch.setattr(mysql_gatherer_module.logger, "opt",
+                        lambda **kwargs: Prodict(info=lambda msg: completed.append(msg.split()[0])))
+
+    # When:
+    started = time.time()
+    updates, issues = MySqlGatherer(None, max_concurrency=2, deadline=1).gather(model)
+    elapsed = time.time() - started
+
+    # Then:
+    # The late probe is reported at its deadline, but keeps its thread until it's over.
+    assert 1.5 <= elapsed < 2
+    assert max(max_running) == 2
+    assert completed == ["daunt-books", "blackwells", "foyles", "whsmith", "waterstones"]
+    assert [(issue.id, issue.message) for issue in issues] == [("foyles", "ERROR: No answer after 1 seconds")]
+    assert_dict_equals(updates, {"aws": {"databases": {
+        "blackwells": {"status": "ACCESSIBLE"},
+        "whsmith": {"status": "ACCESSIBLE"},
+        "waterstones": {"status": "ACCESSIBLE"},
+    }}})
+
+
+def test_mysql_check_instance_socket_factory():
+    # Given:
+    addresses = []
+
+    def socket_factory(address, timeout):
+        addresses.append((address, timeout))
+        raise ConnectionRefusedError("Connection refused")
+
+    db = Prodict(endpoint={"address": "blackwells.acme.com", "port": 3306},
+                 master_username="root", master_password="focused_mendel")
+    original_socket = socket.socket
+
+    # When:
+    success, message = mysql_gatherer_module._check_mysql_instance(db, socket_factory)
+
+    # Then:
+    assert not success
+    assert "blackwells.acme.com:3306" in message
+    assert addresses == [(("blackwells.acme.com", 3306), mysql_gatherer_module.MYSQL_CONNECT_TIMEOUT)]
+    assert socket.socket is original_socket
+
+
+def test_mysql_socket_read_timeout():
+    # Given:
+    server, client = socket.socketpair()
+    mysql_socket = _MySQLFactorySocket(lambda address, timeout: client, 2.5, host="blackwells.acme.com", port=3306)
+    mysql_socket.set_connection_timeout(mysql_gatherer_module.MYSQL_CONNECT_TIMEOUT)
+
+    # When:
+    mysql_socket.open_connection()
+    connect_timeout = client.gettimeout()
+    # ... as done by the connector once logged in
+    mysql_socket.set_connection_timeout(None)
+
+    # Then:
+    server.close()
+    client.close()
+    assert connect_timeout == mysql_gatherer_module.MYSQL_CONNECT_TIMEOUT
+    assert client.gettimeout() == 2.5
+
+
+def test_mysql_gather_rds_status_roles_on_login(monkeypatch):
+    # Given:
+    roles_on_login = {"blackwells": 1, "foyles": 0}
+
+    class Cursor:
+        def __init__(self, db):
+            self.db = db
+
+        def execute(self, query):
+            assert query == mysql_gatherer_module.ROLES_ON_LOGIN_QUERY
+
+        def fetchall(self):
+            return [(roles_on_login[self.db.db_name],)]
+
+        def close(self):
+            pass
+
+    class Connection:
+        def __init__(self, db):
+            self.db = db
+
+        def get_server_info(self):
+            return "8.0.23"
+
+        def cursor(self):
+            return Cursor(self.db)
+
+        def is_connected(self):
+            return False
+
+    monkeypatch.setattr(mysql_gatherer_module, "connect_instance", lambda db, *args: Connection(db))
+    model = Prodict(
+        aws={"databases": {db_name: {"endpoint": {"address": db_name, "port": 3306}, "db_name": db_name}
+                           for db_name in roles_on_login}},
+        custom={"grant_mode": "role"},
+    )
+
+    # When:
+    updates, issues = MySqlGatherer(None).gather(model)
+
+    # Then:
+    assert [(issue.level, issue.id) for issue in issues] == [(IssueLevel.WARNING, "foyles")]
+    assert_dict_equals(updates, {"aws": {"databases": {
+        "blackwells": {"status": "ACCESSIBLE"},
+        "foyles": {"status": "ACCESSIBLE"},
+    }}})
+
+
+def test_mysql_gather_grants_drift(monkeypatch):
+    # Given:
+    live_rows = {
+        "blackwells": [("alice", "blackwells", "SELECT"), ("bob", "blackwells", "SELECT"),
+                       ("bob", "blackwells", "UPDATE"), ("carol", None, None)],
+        "foyles": [("alice", "foyles", "SELECT")],
+    }
+    monkeypatch.setattr(grants_gatherer_module, "_read_grants",
+                        lambda db, **kwargs: (True, to_grants(live_rows[db.db_name])))
+    query = {"db_names": ["blackwells"], "grant_type": "query"}
+    model = Prodict(
+        aws={"databases": {
+            "eu-west-2/blackwells": {"status": "ACCESSIBLE", "db_name": "blackwells",
+                                     "permissions": {"alice": query, "bob": query, "dave": query}},
+            "eu-west-2/foyles": {"status": "ACCESSIBLE", "db_name": "foyles",
+                                 "permissions": {"alice": {"db_names": ["foyles"], "grant_type": "query"}}},
+            "eu-west-2/whsmith": {"status": "ENABLED", "db_name": "whsmith"},
+        }},
+        okta={"users": {
+            "alice": {"status": "ACTIVE"},
+            "bob": {"status": "ACTIVE"},
+            "dave": {"status": "ACTIVE"},
+        }},
+        custom={},
+        grant_types={"query": ["SELECT"]},
+    )
+
+    # When:
+    updates, issues = MySqlGrantsGatherer().gather(model)
+
+    # Then:
+    assert [(issue.level, issue.type, issue.id) for issue in issues] == [
+        (IssueLevel.WARNING, "GRANT", "eu-west-2/blackwells/bob"),
+        (IssueLevel.WARNING, "GRANT", "eu-west-2/blackwells/dave"),
+        (IssueLevel.WARNING, "GRANT", "eu-west-2/blackwells/carol"),
+    ]
+    assert_dict_equals(updates, {"aws": {"databases": {
+        "eu-west-2/blackwells": {
+            "live_grants": {
+                "alice": {"blackwells": ["SELECT"]},
+                "bob": {"blackwells": ["SELECT", "UPDATE"]},
+                "carol": {},
+            },
+            "grant_drift": ["bob", "dave"],
+            "orphaned_users": ["carol"],
+        },
+        "eu-west-2/foyles": {
+            "live_grants": {"alice": {"foyles": ["SELECT"]}},
+            "grant_drift": [],
+            "orphaned_users": [],
+        },
+    }}})
+
+
+def test_mysql_gather_grants_role_mode(monkeypatch):
+    # Given:
+    queries = []
+    # Privileges granted both directly and through a role
+    live_rows = [("alice", "blackwells", "SELECT"), ("alice", "blackwells", "SELECT"), ("alice", "foyles", "SELECT")]
+    monkeypatch.setattr(grants_gatherer_module, "_read_grants",
+                        lambda db, query, **kwargs: queries.append(query) or (True, to_grants(live_rows)))
+    model = Prodict(
+        aws={"databases": {
+            "eu-west-2/blackwells": {"status": "ACCESSIBLE", "db_name": "blackwells",
+                                     "permissions": {"alice": {"db_names": ["blackwells", "foyles"],
+                                                               "grant_type": "query"}}},
+        }},
+        okta={"users": {"alice": {"status": "ACTIVE"}}},
+        custom={"grant_mode": "role", "grant_types": {"query": ["SELECT"]}},
+    )
+
+    # When:
+    updates, issues = MySqlGrantsGatherer().gather(model)
+
+    # Then:
+    assert queries == [SARI_MANAGED_ROLE_GRANTS_QUERY]
+    assert not issues
+    assert updates.aws.databases["eu-west-2/blackwells"]["live_grants"] == {
+        "alice": {"blackwells": ["SELECT"], "foyles": ["SELECT"]},
+    }
+
+
+def test_mysql_gather_grants_normalized(monkeypatch):
+    # Given:
+    live_rows = [("alice", "blackwells", privilege) for privilege in ALL_SCHEMA_PRIVILEGES] + \
+                [("bob", "blackwells", "SELECT"), ("bob", "blackwells", "LOCK TABLES")]
+    monkeypatch.setattr(grants_gatherer_module, "_read_grants",
+                        lambda db, **kwargs: (True, to_grants(live_rows)))
+    model = Prodict(
+        aws={"databases": {
+            "eu-west-2/blackwells": {"status": "ACCESSIBLE", "db_name": "blackwells",
+                                     "permissions": {"alice": {"db_names": ["blackwells"], "grant_type": "all"},
+                                                     "bob": {"db_names": ["blackwells"], "grant_type": "query"}}},
+        }},
+        okta={"users": {"alice": {"status": "ACTIVE"}, "bob": {"status": "ACTIVE"}}},
+        custom={"grant_types": {"all": ["ALL PRIVILEGES"], "query": ["select", "lock  tables"]}},
+    )
+
+    # When:
+    updates, issues = MySqlGrantsGatherer().gather(model)
+
+    # Then:
+    assert not issues
+    assert updates.aws.databases["eu-west-2/blackwells"]["grant_drift"] == []
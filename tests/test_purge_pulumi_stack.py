@@ -1,7 +1,7 @@
 import json
 from pathlib import Path
 
-from main.util import assert_dict_equals, purge_pulumi_stack
+from main.util import assert_dict_equals, get_mysql_provider_endpoints, purge_pulumi_stack
 
 
 def test_purge_acme_pulumi_stack():
@@ -9,5 +9,27 @@ def test_purge_acme_pulumi_stack():
     original_stack = json.loads(Path("tests/data/stk-acme.json").read_text())
     purged_stack = json.loads(Path("tests/data/stk-acme-purged.json").read_text())
     stack, num_changes = purge_pulumi_stack(original_stack, rds_known_endpoints)
+    assert get_mysql_provider_endpoints(original_stack) == {"blackwells.c36k3kl10p4v.eu-west-1.rds.amazonaws.com:3306",
+                                                            "whsmith.c36k3kl10p4v.eu-west-1.rds.amazonaws.com:3306"}
     assert num_changes == 7
     assert_dict_equals(stack, purged_stack)
+
+
+def test_purge_dependents_of_zombie_resources():
+    def resource(name: str, res_type: str = "mysql:index/user:User", **kwargs) -> dict:
+        return dict(urn=f"urn:pulumi:acme::sari::{res_type}::{name}", type=res_type, **kwargs)
+
+    provider = resource("whsmith", "pulumi:providers:mysql", id="42", inputs={"endpoint": "whsmith.acme.com:3306"})
+    provider_ref = f"{provider['urn']}::42"
+    user = resource("whsmith/alice", provider=provider_ref)
+    grant = resource("whsmith/alice", "mysql:index/grant:Grant", dependencies=[user["urn"]])
+    child = resource("whsmith/alice/child", "aws:ssm/parameter:Parameter", parent=grant["urn"])
+    unrelated = resource("glue/whsmith", "random:index/randomPassword:RandomPassword")
+    original_stack = {"version": 3, "deployment": {"manifest": {},
+                                                   "resources": [provider, user, grant, child, unrelated]}}
+
+    stack, num_changes = purge_pulumi_stack(original_stack, set())
+
+    assert num_changes == 4
+    assert stack == {"version": 3, "deployment": {"manifest": {}, "resources": [unrelated]}}
+    assert len(original_stack["deployment"]["resources"]) == 5
@@ -0,0 +1,68 @@
+import time
+from io import BytesIO
+from typing import List
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+
+from main.util.request_ext import RateLimitedAdapter, RateLimiter
+
+
+def _response(status_code: int, remaining: int = None, reset_time: float = None) -> Response:
+    response = Response()
+    response.status_code = status_code
+    response.raw = BytesIO()
+    if remaining is not None:
+        response.headers["X-Rate-Limit-Remaining"] = str(remaining)
+    if reset_time is not None:
+        response.headers["X-Rate-Limit-Reset"] = str(int(reset_time))
+    return response
+
+
+def test_rate_limiter_adapts_concurrency():
+    # Given:
+    limiter = RateLimiter(8)
+
+    # When/Then:
+    limiter.acquire()
+    limiter.release(_response(200, remaining=3))
+    assert limiter.concurrency == 3
+    limiter.acquire()
+    limiter.release(_response(200))
+    assert limiter.concurrency == 3
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(_response(200, remaining=500))
+    assert limiter.concurrency == 8
+    assert limiter.in_flight == 0
+
+
+def test_rate_limiter_pauses_until_reset():
+    # Given:
+    limiter = RateLimiter(8)
+    reset_time = time.time() + 1
+
+    # When:
+    limiter.acquire()
+    limiter.release(_response(200, remaining=0, reset_time=reset_time))
+    limiter.acquire()
+
+    # Then:
+    assert time.time() >= int(reset_time)
+    assert limiter.concurrency == 4
+
+
+def test_rate_limited_adapter_retries_after_reset(monkeypatch):
+    # Given:
+    responses: List[Response] = [_response(429, remaining=0, reset_time=time.time()), _response(200, remaining=9)]
+    monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kwargs: responses.pop(0))
+    limiter = RateLimiter(2)
+    adapter = RateLimitedAdapter(limiter)
+
+    # When:
+    response = adapter.send(PreparedRequest())
+
+    # Then:
+    assert response.status_code == 200
+    assert not responses
+    assert limiter.in_flight == 0
@@ -0,0 +1,76 @@
+from typing import List, Tuple
+
+from prodict import Prodict
+
+from main.aws_client import AwsClient
+from main.domain import Issue
+from main.gatherer.aws import AwsGatherer
+from main.gatherer.config import DatabaseConfigGatherer, UserConfigGatherer, ServiceConfigGatherer, \
+    ApplicationConfigGatherer
+from main.gatherer.dbinfo import DatabaseInfoGatherer
+from main.gatherer.gatherer import Gatherer
+from main.gatherer.mysql import MySqlGatherer
+from main.gatherer.okta import OktaGatherer, OktaGroupGatherer
+from main.gatherer.scheduler import keys_overlap, schedule_gatherers
+
+AWS_REGION_US = "us-east-1"
+AWS_REGION_UK = "eu-west-2"
+
+
+class _Undeclared(Gatherer):
+    def gather(self, model: Prodict) -> Tuple[Prodict, List[Issue]]:
+        return Prodict(), []
+
+
+def test_keys_overlap():
+    assert keys_overlap("aws.databases", "aws")
+    assert keys_overlap("aws", "aws.databases.eu-west-2")
+    assert keys_overlap("", "okta.users")
+    assert not keys_overlap("aws.databases.eu-west-2", "aws.databases.us-east-1")
+    assert not keys_overlap("aws.account", "aws.databases")
+    assert not keys_overlap("okta.users", "okta.user")
+
+
+def test_schedule_all_gatherers():
+    # Given:
+    aws_clients = {region: AwsClient(region) for region in (AWS_REGION_US, AWS_REGION_UK)}
+    aws = AwsGatherer(aws_clients[AWS_REGION_US])
+    db_config = {region: DatabaseConfigGatherer(region, f"tests/data/{region}/databases.yaml", None)
+                 for region in aws_clients}
+    db_info = {region: DatabaseInfoGatherer(aws_client, None) for region, aws_client in aws_clients.items()}
+    mysql = MySqlGatherer(None)
+    user_config = UserConfigGatherer("tests/data/users.yaml")
+    svc_config = ServiceConfigGatherer("tests/data/services.yaml")
+    app_config = ApplicationConfigGatherer("tests/data/applications.yaml")
+    okta_groups = OktaGroupGatherer(None, None)
+    okta = OktaGatherer(None, None)
+
+    # When:
+    waves = schedule_gatherers([
+        aws,
+        db_config[AWS_REGION_US], db_info[AWS_REGION_US],
+        db_config[AWS_REGION_UK], db_info[AWS_REGION_UK],
+        user_config, svc_config, app_config, okta_groups, okta, mysql,
+    ])
+
+    # Then:
+    assert waves == [
+        [aws, db_config[AWS_REGION_US], db_config[AWS_REGION_UK]],
+        [db_info[AWS_REGION_US], db_info[AWS_REGION_UK]],
+        [user_config],
+        [svc_config, app_config, okta_groups],
+        # The probes share a wave with the Okta users fetch.
+        [okta, mysql],
+    ]
+
+
+def test_schedule_undeclared_gatherer():
+    # Given:
+    first, second = _Undeclared(), _Undeclared()
+    aws = AwsGatherer(AwsClient(AWS_REGION_US))
+
+    # When:
+    waves = schedule_gatherers([first, second, aws])
+
+    # Then:
+    assert waves == [[first, aws], [second]]
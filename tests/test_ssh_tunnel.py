@@ -0,0 +1,83 @@
+import socket
+import threading
+
+import paramiko
+from paramiko import OPEN_SUCCEEDED, AUTH_SUCCESSFUL, AUTH_FAILED, RSAKey
+
+from main.util import SshTunnel
+
+PROXY_USERNAME = "sari-proxy"
+
+
+class _BastionHost(paramiko.ServerInterface):
+    def __init__(self, client_key: RSAKey):
+        self.client_key = client_key
+        self.destinations = []
+
+    def check_auth_publickey(self, username, key):
+        return AUTH_SUCCESSFUL if username == PROXY_USERNAME and key == self.client_key else AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.destinations.append(destination)
+        return OPEN_SUCCEEDED
+
+
+def _serve(listener: socket.socket, host_key: RSAKey, bastion: _BastionHost, connections: list):
+    """Accepts SSH connections, echoing back whatever is sent over their channels."""
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except OSError:
+            return
+        connections.append(conn)
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(host_key)
+        transport.start_server(server=bastion)
+
+        threading.Thread(target=_accept_channels, args=(transport,), daemon=True).start()
+
+
+def _accept_channels(transport: paramiko.Transport):
+    while True:
+        channel = transport.accept()
+        if channel is None:
+            return
+        threading.Thread(target=_echo, args=(channel,), daemon=True).start()
+
+
+def _echo(channel: paramiko.Channel):
+    for data in iter(lambda: channel.recv(1024), b""):
+        channel.sendall(data)
+
+
+def test_ssh_tunnel_multiplexes_connections():
+    # Given:
+    host_key = RSAKey.generate(1024)
+    client_key = RSAKey.generate(1024)
+    bastion = _BastionHost(client_key)
+    connections = []
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    threading.Thread(target=_serve, args=(listener, host_key, bastion, connections), daemon=True).start()
+    destinations = [("blackwells.rds.amazonaws.com", 3306), ("whsmith.rds.amazonaws.com", 3307)]
+
+    # When:
+    replies = []
+    with SshTunnel("127.0.0.1", PROXY_USERNAME, port=listener.getsockname()[1], pkey=client_key) as tunnel:
+        for address in destinations:
+            sock = tunnel.create_connection(address, timeout=5)
+            sock.sendall(address[0].encode())
+            buffer = bytearray(100)
+            size = sock.recv_into(buffer)
+            replies.append(bytes(buffer[:size]).decode())
+            sock.close()
+    listener.close()
+
+    # Then:
+    assert len(connections) == 1
+    assert bastion.destinations == destinations
+    assert replies == [host for host, _ in destinations]
@@ -0,0 +1,139 @@
+import copy
+import pickle
+from typing import List, Optional, Sequence
+
+import bson
+import pytest
+from prodict import Prodict
+
+from main.domain import Permission, compact_permissions, encode_permission
+import main.driver as driver_module
+from main.driver import run_pulumi, shard_stack_name
+from main.updater import ModelChanges, parse_shard, sort_shards
+from main.updater.changes import diff_snapshots, take_snapshot
+
+
+def test_parse_shard():
+    assert parse_shard("mysql:eu-west-2") == ("mysql", "eu-west-2")
+    assert parse_shard("applications") == ("applications", None)
+    assert parse_shard("iam") == ("iam", None)
+    with pytest.raises(ValueError):
+        parse_shard("iam:eu-west-2")
+    with pytest.raises(ValueError):
+        parse_shard("grants")
+
+
+def test_sort_shards():
+    assert sort_shards(["applications:eu-west-2", "iam", "mysql:eu-west-2", "applications:us-east-1"]) == \
+           ["iam", "mysql:eu-west-2", "applications:eu-west-2", "applications:us-east-1"]
+
+
+def test_shard_stack_name():
+    assert shard_stack_name("acme", "mysql:eu-west-2") == "acme.mysql.eu-west-2"
+    assert shard_stack_name("acme", "iam") == "acme.iam"
+
+
+def _model(master_password: str = "focused_mendel", grant_type: str = "query") -> Prodict:
+    permission = {"db_names": ["blackwells"], "grant_type": grant_type}
+    return Prodict.from_dict({
+        "aws": {"databases": {
+            "eu-west-2/blackwells": {"status": "ACCESSIBLE", "master_password": master_password, "password_age": 3,
+                                     "permissions": {"alice@acme.com": permission}},
+            "us-east-1/foyles": {"status": "ACCESSIBLE", "master_password": "quirky_ganguly", "permissions": {}},
+        }},
+        "okta": {"users": {"alice@acme.com": {"status": "ACTIVE",
+                                              "permissions": {"eu-west-2/blackwells": permission}}}},
+        "applications": {},
+        "job": {"next_transition": None},
+        "custom": {},
+    })
+
+
+def test_model_changes_select_shards(tmp_path):
+    # Given:
+    shards = ["iam", "bastion_host", "mysql:eu-west-2", "mysql:us-east-1", "applications"]
+
+    def select_shards(model: Prodict, committed: Optional[List[str]] = None, all_shards: Sequence[str] = shards):
+        model_changes = ModelChanges(str(tmp_path), "acme")
+        selected = model_changes.select_shards(model, all_shards)
+        model_changes.commit(selected if committed is None else committed)
+        return selected
+
+    # When/Then:
+    assert select_shards(_model()) == shards
+    assert select_shards(_model()) == []
+    assert select_shards(_model(master_password="hungry_turing")) == []
+    assert select_shards(_model(grant_type="crud"), committed=[]) == ["iam", "bastion_host", "mysql:eu-west-2"]
+    # Not applied yet, then only partially
+    assert select_shards(_model(grant_type="crud"), committed=["iam"]) == ["iam", "bastion_host", "mysql:eu-west-2"]
+    assert select_shards(_model(grant_type="crud")) == ["bastion_host", "mysql:eu-west-2"]
+    assert select_shards(_model(grant_type="crud")) == []
+    # Never updated so far
+    assert select_shards(_model(grant_type="crud"), all_shards=(*shards, "cloudwatch")) == ["cloudwatch"]
+    assert ModelChanges(str(tmp_path), "acme").select_shards(_model(grant_type="crud")) == ["*"]
+
+
+def test_model_snapshot_secrets():
+    # Given:
+    previous = take_snapshot(_model())
+    current = take_snapshot(_model(master_password="hungry_turing"))
+
+    # When:
+    diff = diff_snapshots(previous, current)
+
+    # Then:
+    assert "master_password" not in str(previous)
+    assert "password_age" not in str(previous)
+    assert diff == {}
+
+
+def test_run_pulumi_model_changes(monkeypatch, tmp_path):
+    # Given:
+    actions = []
+
+    class Stack:
+        def __init__(self, name: str, **kwargs):
+            self.name = name
+
+        def __getattr__(self, action: str):
+            return lambda on_output: actions.append((self.name, action))
+
+    monkeypatch.setattr(driver_module.auto, "create_or_select_stack", Stack)
+
+    def run(action: str):
+        run_pulumi(_model(), "acme", action, ["iam"], model_changes=ModelChanges(str(tmp_path), "acme"))
+
+    # When:
+    run("up")
+    run("preview")
+    run("up")
+    run("refresh")
+    run("destroy")
+
+    # Then:
+    assert actions == [("acme.iam", "up"), ("acme.iam", "refresh"), ("acme.iam", "destroy")]
+
+
+def test_model_compact_permissions():
+    # Given:
+    model = _model()
+    expected = bson.loads(bson.dumps(model))
+
+    # When:
+    compact_model = compact_permissions(_model())
+    serialized = bson.loads(bson.dumps(compact_model, on_unknown=encode_permission))
+
+    # Then:
+    user_permission = compact_model.okta.users["alice@acme.com"].permissions["eu-west-2/blackwells"]
+    db_permission = compact_model.aws.databases["eu-west-2/blackwells"].permissions["alice@acme.com"]
+    assert user_permission is db_permission is Permission.of(["blackwells"], "query")
+    assert user_permission.grant_type == user_permission["grant_type"] == user_permission.get("grant_type") == "query"
+    assert user_permission.get("db_name") is None
+    with pytest.raises(KeyError):
+        user_permission["db_name"]
+    assert pickle.loads(pickle.dumps(user_permission)) is user_permission
+    assert copy.deepcopy(compact_model).aws.databases["eu-west-2/blackwells"].permissions["alice@acme.com"] \
+        is user_permission
+    assert user_permission == {"db_names": ["blackwells"], "grant_type": "query"}
+    assert serialized == expected
+    assert take_snapshot(compact_model) == take_snapshot(model)
@@ -0,0 +1,46 @@
+import pytest
+
+from main.util import WildcardIndex, wc_expand
+
+DB_UIDS = [
+    "eu-west-2/whsmith",
+    "us-east-1/borders",
+    "eu-west-2/blackwells",
+    "eu-west-1/foyles",
+    "eu-west-2/blackwells-archive",
+    "us-east-1/barnes-and-noble",
+]
+
+
+@pytest.mark.parametrize("db_ref", [
+    "eu-west-2/blackwells",
+    "eu-west-2/waterstones",
+    "eu-west-2/*",
+    "eu-west-?/*",
+    "*/b*",
+    "us-east-1/[bw]*",
+    "eu-west-2/blackwells*",
+    "*",
+])
+def test_wildcard_index_expand(db_ref: str):
+    index = WildcardIndex(DB_UIDS)
+    assert index.expand(db_ref) == wc_expand(db_ref, DB_UIDS)
+    # Memoized, but not shared with the caller
+    index.expand(db_ref).append("eu-west-2/waterstones")
+    assert index.expand(db_ref) == wc_expand(db_ref, DB_UIDS)
+
+
+def test_wildcard_index_select_by_tags():
+    tags = {
+        "eu-west-2/whsmith": {"team": "payments", "env": "prod"},
+        "us-east-1/borders": {"team": "payments", "env": "test"},
+        "eu-west-2/blackwells": {"team": "catalog", "env": "prod"},
+        "eu-west-1/waterstones": {"team": "payments"},
+    }
+    index = WildcardIndex(DB_UIDS, tags)
+    assert index.expand({"tags": {"team": "payments"}}) == ["eu-west-2/whsmith", "us-east-1/borders"]
+    assert index.expand({"tags": {"env": "prod", "team": "payments"}}) == ["eu-west-2/whsmith"]
+    assert index.expand({"tags": {"team": "payments"}, "id": "us-*"}) == ["us-east-1/borders"]
+    assert index.expand({"tags": {"team": "shipping"}}) == []
+    assert index.expand({"id": "eu-west-2/b*"}) == wc_expand("eu-west-2/b*", DB_UIDS)
+    assert index.expand({}) == []